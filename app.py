@@ -3,9 +3,27 @@
 import streamlit as st
 import requests
 import json
+from requests.adapters import HTTPAdapter
 
 API_URL_PHASE_1 = "http://localhost:8000/phase_1"  
 API_URL_PHASE_2 = "http://localhost:8000/phase_2"  
+REQUEST_TIMEOUT = 120  # seconds
+
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """One pooled keep-alive session per server process, shared by all reruns and users."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=20)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def post_json(url: str, payload: dict) -> dict:
+    response = get_http_session().post(url, json=payload, timeout=REQUEST_TIMEOUT)
+    return response.json()
+
 
 st.title("🩺 HMO Medical Assistant")
 
@@ -26,35 +44,35 @@ if not st.session_state.language_selected:
         st.session_state.language_selected = True
         st.rerun()
         
-if st.session_state.language_selected and not st.session_state.history:
-    try:
-        response = requests.post(API_URL_PHASE_1, json={
-            "language": st.session_state.language,
-            "user_input": "start",
-            "hmo": "",
-            "tier": "",
-            "confirmed": "",
-            "history": []
-
-        })
-
-        result = response.json()
-
-        assistant_reply = result.get("response", "⚠️ No response from server.")
-        st.session_state.history.append({"role": "assistant", "content": assistant_reply})   
-
-
-    except Exception as e:
-        st.session_state.history.append(
-            {"role": "assistant", "content": f"❌ Error: {e}"}
-        )
-
 
-# Chat Interface (Phase 1 or 2 depending on confirmation)
-if st.session_state.language_selected:
-    for msg in st.session_state.history:
-        with st.chat_message(msg["role"]):
-            st.markdown(msg["content"])
+@st.fragment
+def chat_interface():
+    """
+    Chat area. Runs as a fragment, so sending a message reruns only this function instead of the whole script,
+    and the new turn is drawn in place (with a pending indicator) rather than via a full st.rerun().
+    """
+    if not st.session_state.history:
+        with st.chat_message("assistant"):
+            with st.spinner("..."):
+                try:
+                    result = post_json(API_URL_PHASE_1, {
+                        "language": st.session_state.language,
+                        "user_input": "start",
+                        "hmo": "",
+                        "tier": "",
+                        "confirmed": "",
+                        "history": []
+
+                    })
+                    assistant_reply = result.get("response", "⚠️ No response from server.")
+                except Exception as e:
+                    assistant_reply = f"❌ Error: {e}"
+            st.markdown(assistant_reply)
+        st.session_state.history.append({"role": "assistant", "content": assistant_reply})
+    else:
+        for msg in st.session_state.history:
+            with st.chat_message(msg["role"]):
+                st.markdown(msg["content"])
 
     
     user_input = st.chat_input("Enter your message...")
@@ -64,56 +82,66 @@ if st.session_state.language_selected:
         with st.chat_message("user"):
             st.markdown(user_input)
 
-        if st.session_state.inputs.get("confirmation") is True:
-            # PHASE 2: Ask about medical services
-            try:
-                phase2_response = requests.post(API_URL_PHASE_2, json={
-                    "hmo": st.session_state.inputs.get("hmo", ""),
-                    "tier": st.session_state.inputs.get("tier", ""),
-                    "lang": st.session_state.language,
-                    "question": user_input
-                })
-                phase2_data = phase2_response.json()
-                assistant_reply = phase2_data.get("answer", "⚠️ No answer received.")
+        with st.chat_message("assistant"):
+            with st.spinner("..."):
+                assistant_reply = get_assistant_reply(user_input)
+            st.markdown(assistant_reply)
 
-            except Exception as e:
-                assistant_reply = f"❌ Error calling phase 2: {e}"
+        st.session_state.history.append({"role": "assistant", "content": assistant_reply})
 
-            
 
-        else:
-            # Phase 1: Continue information collection
-            try:
-                response = requests.post(API_URL_PHASE_1, json={
-                    "language": st.session_state.language,
-                    "hmo": st.session_state.inputs["hmo"],
-                    "tier": st.session_state.inputs["tier"],
-                    "confirmed": st.session_state.inputs["confirmation"],
-                    "user_input": user_input,
-                    "history": st.session_state.history[:-1]
-                })
-                result = response.json()
-                assistant_reply = result.get("response", "⚠️ No response from server.")
+def get_assistant_reply(user_input: str) -> str:
+    if st.session_state.inputs.get("confirmation") is True:
+        # PHASE 2: Ask about medical services
+        try:
+            phase2_data = post_json(API_URL_PHASE_2, {
+                "hmo": st.session_state.inputs.get("hmo", ""),
+                "tier": st.session_state.inputs.get("tier", ""),
+                "lang": st.session_state.language,
+                "question": user_input
+            })
+            assistant_reply = phase2_data.get("answer", "⚠️ No answer received.")
 
-                try:
-                    # Set from the backend directly
-                    st.session_state.inputs = result.get("inputs", st.session_state.inputs)
+        except Exception as e:
+            assistant_reply = f"❌ Error calling phase 2: {e}"
 
-                    #update the confirmation state based on the response
-                    if "confirmed" in result:
-                        st.session_state.inputs["confirmation"] = result["confirmed"]
+        
 
-                    # Show assistant message (may be plain string)
-                    assistant_reply = result.get("response", "⚠️ No response from server.")
+    else:
+        # Phase 1: Continue information collection
+        try:
+            result = post_json(API_URL_PHASE_1, {
+                "language": st.session_state.language,
+                "hmo": st.session_state.inputs["hmo"],
+                "tier": st.session_state.inputs["tier"],
+                "confirmed": st.session_state.inputs["confirmation"],
+                "collected": st.session_state.inputs.get("collected", []),
+                "user_input": user_input,
+                "history": st.session_state.history[:-1]
+            })
+            assistant_reply = result.get("response", "⚠️ No response from server.")
 
-                except Exception as e:
-                    assistant_reply = f"❌ Error parsing response: {e}"
+            try:
+                # Set from the backend directly
+                st.session_state.inputs = result.get("inputs", st.session_state.inputs)
 
+                #update the confirmation state based on the response
+                if "confirmed" in result:
+                    st.session_state.inputs["confirmation"] = result["confirmed"]
+
+                # Show assistant message (may be plain string)
+                assistant_reply = result.get("response", "⚠️ No response from server.")
 
             except Exception as e:
-                assistant_reply = f"❌ Error: {e}"
+                assistant_reply = f"❌ Error parsing response: {e}"
 
-        st.session_state.history.append({"role": "assistant", "content": assistant_reply})
-        with st.chat_message("assistant"):
-            st.markdown(assistant_reply)
 
+        except Exception as e:
+            assistant_reply = f"❌ Error: {e}"
+
+    return assistant_reply
+
+
+# Chat Interface (Phase 1 or 2 depending on confirmation)
+if st.session_state.language_selected:
+    chat_interface()
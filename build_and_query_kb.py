@@ -7,7 +7,7 @@ from src.extract_data_embd import run_extraction
 from src.embd_chunks import (
     build_and_save_index,
     load_data,
-    get_embedding,
+    embed_query,
     filter_by_hmo_tier,
     get_top_matches,
     get_answer_from_metadata
@@ -21,7 +21,7 @@ def ask_question(question: str, hmo: str, tier: str, top_k: int = 5):
     index, metadata = load_data()
 
     # Embed the question
-    query_vector = get_embedding(question)
+    query_vector = embed_query(question)
 
     # Filter metadata by HMO and tier
     mask = filter_by_hmo_tier(metadata, hmo=hmo, tier=tier)
@@ -2,42 +2,144 @@
 # chat_api.py
 
 import os
-import logging
+from logic.startup_timing import startup_timer
+startup_timer.install_import_hook()
+
 import json
-from fastapi import FastAPI
+import hmac
+import asyncio
+import logging
+import importlib
+import threading
+import openai
+from typing import List, Optional, Tuple, Union
+from fastapi import FastAPI, BackgroundTasks, Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from logic.azure_calls import get_chat_completion, get_embedding
-from tools import tool_descriptions, collect_hmo, collect_insurance_tier, confirm_information, collect_age, collect_name, collect_card_number, collect_id_number, collect_gender
-from src.extract_data_embd import run_extraction
-from src.embd_chunks import normalize_hmo_tier, load_data, get_top_matches, get_answer_from_metadata, filter_by_hmo_tier, build_and_save_index, is_kb_ready
+from logic.log_config import setup_logging, shutdown_logging
+from logic.azure_calls import get_chat_completion, route_stats, PRIORITY_INTERACTIVE
+from logic.azure_scheduler import scheduler
+from logic.singleflight import AsyncSingleFlight
+from logic.deadline import Deadline, DeadlineExceeded, RequestCancelled, deadline_scope
+from logic.profiling import profiler, memory_tracer
+from logic.cache import LRUCache
+from logic.translation import normalize_text
+from tools import handle_tool_call, filled_slot, phase1_tool_args
+from src.embd_chunks import normalize_hmo_tier, get_answer_from_metadata, is_kb_ready, kb_version, list_kb_versions, rollback_kb, CONTEXT_CANDIDATES
+from src.retrieval_service import get_router, retrieve_context, retrieve_contexts, prepare_question, kb_memory_report
+from src.prefetch import prefetch_profile, warm_questions
+from src.hot_questions import get_query_log, load_hot_questions
 from pathlib import Path
 
+startup_timer.mark("imports")
 
-# Set up logging
-os.makedirs("logs", exist_ok=True)
-log_file = "logs/chatbot.log"
-file_handler = logging.FileHandler(log_file, mode='a', encoding='utf-8')
-file_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
 
-logger = logging.getLogger()  # Root logger
-logger.setLevel(logging.INFO)
-if not any(isinstance(h, logging.FileHandler) for h in logger.handlers):
-    logger.addHandler(file_handler)
+# Set up logging (queue-based, JSON lines, written off the request path)
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+logger = setup_logging()
 logger.info("🚀 FastAPI server started and logging is working.")
+startup_timer.mark("logging")
 
 
 app = FastAPI()
 
-if not is_kb_ready():
-    print("\n🔧 Knowledge base not found. Building it...")
-    run_extraction()
-    build_and_save_index()
-    print("✅ Knowledge base built.")
-else:
-    print("✅ Knowledge base is already ready. Skipping build.")
+# Identical /phase_2 requests in flight at the same time share one pipeline run (and its deadline)
+phase2_flight = AsyncSingleFlight()
+
+# Time budget of one /phase_2 (or /phase_2/batch) request; with less than PHASE2_MIN_ANSWER_SECONDS left after
+# retrieval, the retrieved chunks are returned without generating an answer
+PHASE2_DEADLINE_SECONDS = float(os.getenv("PHASE2_DEADLINE_SECONDS", "45"))
+PHASE2_BATCH_DEADLINE_SECONDS = float(os.getenv("PHASE2_BATCH_DEADLINE_SECONDS", "120"))
+PHASE2_MIN_ANSWER_SECONDS = float(os.getenv("PHASE2_MIN_ANSWER_SECONDS", "3"))
+DISCONNECT_POLL_SECONDS = 0.5
+
+# Max answer completions running at once for a single /phase_2/batch request
+PHASE2_BATCH_CONCURRENCY = int(os.getenv("PHASE2_BATCH_CONCURRENCY", "4"))
+
+# Finished answers per (kb_version, hmo, tier, lang, normalized question); degraded answers are never cached
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+answer_cache = LRUCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+
+def answer_cache_key(version: str, hmo_norm: str, tier_norm: str, lang: str, question: str) -> tuple:
+    return (version, hmo_norm, tier_norm, lang.lower(), normalize_text(question))
+
+# On startup, answer the top CACHE_WARM_TOP_N hot questions of every scope (data/hot_questions.json, built by
+# `python -m src.hot_questions`) before serving; warming gives up after CACHE_WARM_SECONDS
+CACHE_WARM_TOP_N = int(os.getenv("CACHE_WARM_TOP_N", "10"))
+CACHE_WARM_SECONDS = float(os.getenv("CACHE_WARM_SECONDS", "120"))
+CACHE_WARM_CONCURRENCY = int(os.getenv("CACHE_WARM_CONCURRENCY", "4"))
+
+# Admin (profiling) endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+MAX_PROFILE_SECONDS = float(os.getenv("MAX_PROFILE_SECONDS", "120"))
+
+
+@app.on_event("shutdown")
+def flush_logs():
+    get_query_log().flush()
+    shutdown_logging()
+
+@app.on_event("startup")
+def start_retrieval():
+    startup_timer.mark("app")
+    if not is_kb_ready():
+        # Extraction (bs4) and build code are only imported when there is something to build
+        from src.extract_data_embd import run_extraction
+        from src.embd_chunks import build_and_save_index
+        print("\n🔧 Knowledge base not found. Building it...")
+        run_extraction()
+        build_and_save_index()
+        print("✅ Knowledge base built.")
+    else:
+        print("✅ Knowledge base is already ready. Skipping build.")
+    startup_timer.mark("kb_check")
+
+    # Connect to (or spawn) the retrieval shards before the first /phase_2 request
+    if get_router().mode == "local":
+        # Shards load on first use; get faiss imported meanwhile so the first search doesn't pay for it
+        threading.Thread(target=importlib.import_module, args=("faiss",), name="faiss-import", daemon=True).start()
+    startup_timer.mark("retrieval_router")
+
+    # Uvicorn only starts accepting requests once startup handlers return, so warming here means ready == warm
+    warm_caches()
+    startup_timer.mark("cache_warm")
+    startup_timer.log_report()
+
+
+def warm_caches() -> None:
+    """Embed, retrieve and answer the hot questions of every scope so the first users after a deploy hit warm caches."""
+    scopes = load_hot_questions(CACHE_WARM_TOP_N) if CACHE_WARM_TOP_N > 0 else []
+    if not scopes:
+        return
+    from concurrent.futures import ThreadPoolExecutor
+
+    deadline = Deadline(CACHE_WARM_SECONDS)
+    jobs = []
+    for scope in scopes:
+        try:
+            hmo_norm, tier_norm = normalize_hmo_tier(scope["hmo"], scope["tier"])
+            with deadline_scope(deadline):
+                warm_questions(hmo_norm, tier_norm, scope["questions"])
+        except Exception as e:
+            logger.warning(f"⚠️ Cache warming failed for ({scope['hmo']}, {scope['tier']}): {e}")
+            continue
+        jobs += [(scope["hmo"], scope["tier"], scope["lang"], question) for question in scope["questions"]]
+
+    def answer(job) -> bool:
+        try:
+            return not answer_phase_2(*job, deadline)["degraded"]
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=CACHE_WARM_CONCURRENCY, thread_name_prefix="cache-warm") as pool:
+        warmed = sum(pool.map(answer, jobs))
+    logger.info(f"🔥 Warmed caches with {warmed}/{len(jobs)} hot questions", extra={
+        "scopes": len(scopes), "expired": deadline.expired
+    })
 
 
 def load_system_prompt(language: str) -> str:
@@ -46,46 +148,6 @@ def load_system_prompt(language: str) -> str:
     with open(prompt_dir / filename, "r", encoding="utf-8") as f:
         return f.read()
 
-def handle_tool_call(tool_name: str, arguments: str):
-    data = json.loads(arguments)
-    if tool_name == "collect_name":
-        return collect_name(data["first_name"], data["last_name"])
-
-    elif tool_name == "collect_id_number":
-        return collect_id_number(data["id_number"])
-    elif tool_name == "collect_gender":
-        return collect_gender(data["gender"])
-    elif tool_name == "collect_age":
-        return collect_age(data["age"])
-    elif tool_name == "collect_hmo":
-        return collect_hmo(data["hmo"])
-    elif tool_name == "collect_card_number":
-            return collect_card_number(data["card_number"])
-    elif tool_name == "collect_insurance_tier":
-        return collect_insurance_tier(data["tier"])
-    elif tool_name == "confirm_information":
-        return confirm_information(data["confirmation"])
-    return "Unknown tool call."    
-
-
-
-def translate_to_hebrew(text: str) -> str:
-    system_message = """
-    You are a helpful assistant that translates English to Hebrew. 
-    You will be given a question in English related to medical services in Israel.
-    Your task is to translate it to Hebrew.
-    Translate the following question from English to Hebrew. Respond with Hebrew only.\n
-    If the following words are in the text, use this mapping to transtlate them: 
-    'HMO' -> 'קופת חולים', 'insurance tier' -> 'רמת ביטוח', 'medical services' -> 'שירותי בריאות', 'maccabi' -> 'מכבי', 'clalit' -> 'כללית', 'meuhedet' -> 'מאוחדת'.
-    """
-
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": text}
-    ]
-    response = get_chat_completion(messages)
-    return response.strip()
-
 
 # Enable CORS (for Streamlit frontend)
 app.add_middleware(
@@ -103,7 +165,8 @@ class ChatRequest(BaseModel):
     language: str 
     hmo: str = ""
     tier: str = ""
-    confirmed: str= ""
+    confirmed: Union[bool, str] = ""
+    collected: List[str] = []  # phase 1 slots already filled (see tools.PHASE1_SLOTS)
 
 
 class Phase2Request(BaseModel):
@@ -112,55 +175,59 @@ class Phase2Request(BaseModel):
     lang: str
     question: str
 
+
+class Phase2BatchRequest(BaseModel):
+    hmo: str
+    tier: str
+    lang: str
+    questions: List[str]
+
 @app.post("/phase_1")
-async def phase_1(request: ChatRequest):
+async def phase_1(request: ChatRequest, background_tasks: BackgroundTasks):
     try:
-        logger.info("📥 Received request:")
-        logger.info(f"Language: {request.language}")
-        logger.info(f"HMO: {request.hmo}, Tier: {request.tier}, Confirmed: {request.confirmed}")
-        logger.info(f"User Input: {request.user_input}")
-        logger.info(f"History Length: {len(request.history)}")
+        logger.info("📥 Phase 1 request received", extra={
+            "language": request.language,
+            "hmo": request.hmo,
+            "tier": request.tier,
+            "confirmed": request.confirmed,
+            "history_len": len(request.history),
+        })
+        logger.info("User input", extra={"verbose": True, "user_input": request.user_input})
 
         system_prompt = load_system_prompt(language=request.language)
-        logger.info("📄 Loaded system prompt")
 
         messages = [{"role": "system", "content": system_prompt}]
         if not request.history and not request.user_input.strip():
             messages.append({"role": "user", "content": "Hello"})
-            logger.info("👋 No history or input – adding 'Hello' message")
         else:
             messages.extend(request.history)
             messages.append({"role": "user", "content": request.user_input})
-            logger.info("🧠 Appended history and user input")
-
-        logger.info("💬 Sending to GPT...")
-        response = get_chat_completion(
-            messages,
-            tools=tool_descriptions,
-            tool_choice="auto",
-            return_raw=True
-        )
-        logger.info("✅ GPT responded")
-
-        choice = response.choices[0]
-        messages.append(choice.message)
 
         updated_inputs = {
             "hmo": request.hmo,
             "tier": request.tier,
-            "confirmation": request.confirmed
+            "confirmation": request.confirmed,
+            "collected": sorted(set(request.collected) | {slot for slot in ("hmo", "tier") if getattr(request, slot)}),
         }
 
-        if choice.finish_reason == "tool_calls":
-            logger.info("🔧 Detected tool calls")
+        # Off the event loop: the scheduler may sleep (rate limit, retry backoff, fallback) before answering
+        response = await run_in_threadpool(
+            get_chat_completion, messages, **phase1_tool_args(updated_inputs["collected"], request.confirmed is True),
+            return_raw=True, route="phase1"
+        )
+        memory_tracer.record_messages(messages)
+        choice = response.choices[0]
+        messages.append(choice.message)
+        logger.info("✅ GPT responded", extra={"verbose": True, "finish_reason": choice.finish_reason})
 
+        if choice.finish_reason == "tool_calls":
             for tool_call in choice.message.tool_calls:
                 tool_name = tool_call.function.name
                 tool_args = tool_call.function.arguments
-                logger.info(f"⚙️ Handling tool: {tool_name} with args: {tool_args}")
-
                 result = handle_tool_call(tool_name, tool_args)
-                logger.info(f"📤 Tool result: {result}")
+                logger.info("⚙️ Handled tool call", extra={
+                    "verbose": True, "tool": tool_name, "tool_args": tool_args, "tool_result": result
+                })
 
                 messages.append({
                     "role": "tool",
@@ -168,25 +235,32 @@ async def phase_1(request: ChatRequest):
                     "content": result
                 })
 
+                slot = filled_slot(tool_name, result)
+                if slot and slot not in updated_inputs["collected"]:
+                    updated_inputs["collected"] = sorted(updated_inputs["collected"] + [slot])
+
                 try:
                     parsed = json.loads(result)
                     updated_inputs["hmo"] = parsed.get("hmo", updated_inputs["hmo"])
                     updated_inputs["tier"] = parsed.get("tier", updated_inputs["tier"])
                     updated_inputs["confirmation"] = parsed.get("confirmed", updated_inputs["confirmation"])
+                    if parsed.get("restart"):
+                        # User rejected the summary: collect everything again
+                        updated_inputs.update({"hmo": "", "tier": "", "collected": []})
                 except json.JSONDecodeError:
                     logger.warning("⚠️ JSON decode error from tool result")
 
-            logger.info("🔁 Sending follow-up request to GPT")
-            follow_up = get_chat_completion(
-                messages,
-                tools=tool_descriptions,
-                tool_choice="auto",
-                return_raw=True
+            if updated_inputs["confirmation"] is True:
+                # Profile just confirmed: warm phase 2 for this (hmo, tier) while the user reads the reply
+                background_tasks.add_task(prefetch_profile, updated_inputs["hmo"], updated_inputs["tier"], request.language)
+
+            follow_up = await run_in_threadpool(
+                get_chat_completion, messages, **phase1_tool_args(updated_inputs["collected"], updated_inputs["confirmation"] is True),
+                return_raw=True, route="phase1_followup"
             )
             follow_choice = follow_up.choices[0]
             messages.append(follow_choice.message)
 
-            logger.info("✅ Returning response from follow-up GPT call")
             return {
                 "response": follow_choice.message.content,
                 "inputs": updated_inputs,
@@ -196,7 +270,6 @@ async def phase_1(request: ChatRequest):
             }
 
         elif choice.finish_reason == "stop":
-            logger.info("🛑 GPT finished without tool calls")
             return {
                 "response": choice.message.content,
                 "inputs": updated_inputs,
@@ -204,35 +277,285 @@ async def phase_1(request: ChatRequest):
             }
 
     except Exception as e:
-        logger.error(f"❌ Exception occurred: {e}")
+        logger.exception(f"❌ Exception occurred: {e}")
         return {"response": f"❌ Internal server error: {str(e)}"}
 
 
 
 
-@app.post("/phase_2")
-async def phase_2(request: Phase2Request):
+DEGRADED_ANSWER_INTRO = {
+    "he": "לא הספקתי לנסח תשובה מלאה בזמן. זה המידע הרלוונטי שמצאתי:",
+    "en": "I couldn't put together a full answer in time. Here is the relevant information I found:",
+}
+
+
+def within(deadline: Deadline, fn, *args):
+    """Run fn(*args) on a worker thread with `deadline` as the current request deadline."""
+    with deadline_scope(deadline):
+        return fn(*args)
+
+
+def generate_answer(question: str, context_chunks: List[str], hmo: str, tier: str, lang: str, deadline: Deadline) -> Tuple[str, bool]:
+    """
+    Answer from the retrieved context; returns (answer, degraded). When the deadline leaves no time to generate,
+    the retrieved chunks themselves are the answer.
+    """
+    with deadline_scope(deadline):
+        if deadline.remaining() >= PHASE2_MIN_ANSWER_SECONDS:
+            try:
+                return get_answer_from_metadata(question, context_chunks, hmo, tier, lang), False
+            except (DeadlineExceeded, openai.APITimeoutError):
+                pass  # the SDK's own timeout (capped to the time left) often fires before the deadline does
+            except Exception:
+                if not deadline.expired:
+                    raise
+        if deadline.cancelled.is_set():
+            deadline.check("answer")  # nobody is waiting for an answer any more
+    logger.warning("⏳ Deadline reached: returning retrieved context without generation", extra={
+        "remaining_s": round(deadline.remaining(), 2), "chunks": len(context_chunks)
+    })
+    intro = DEGRADED_ANSWER_INTRO["en" if lang.lower().startswith("en") else "he"]
+    return intro + "\n\n" + "\n\n".join(f"- {chunk}" for chunk in context_chunks), True
+
+
+def answer_phase_2(hmo: str, tier: str, lang: str, question: str, deadline: Deadline, version: Optional[str] = None) -> dict:
+    """
+    Run the phase 2 pipeline: translate (if needed), embed, retrieve and answer, all within `deadline`, against KB
+    `version` (the one current when the request started; by default the current one).
+    """
+    with deadline_scope(deadline):
+        hmo_norm, tier_norm = normalize_hmo_tier(hmo, tier)
+        version = version or kb_version()
+        cache_key = answer_cache_key(version, hmo_norm, tier_norm, lang, question)
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            return {"answer": cached, "degraded": False, "kb_version": version}
+
+        # Hebrew input passes through untouched whatever the UI language; English is searched on the English side
+        # of a bilingual KB, otherwise translated to Hebrew first
+        deadline.check("translate")
+        user_question, search_lang = prepare_question(question)
+        if user_question != question:
+            logger.info("Translated to Hebrew", extra={"verbose": True, "translated": user_question})
+
+        version, context_chunks = retrieve_context(
+            hmo_norm, tier_norm, user_question, top_k=5, candidates=CONTEXT_CANDIDATES, lang=search_lang, version=version
+        )
+
+    answer, degraded = generate_answer(user_question, context_chunks, hmo, tier, lang, deadline)
+    if not degraded:
+        answer_cache.put(cache_key, answer)
+    return {"answer": answer, "degraded": degraded, "kb_version": version}
+
+
+def record_question(question: str, hmo: str, tier: str, lang: str) -> None:
+    """Count the question (de-identified) for its scope; the hot-question job clusters these counts."""
     try:
-        logger.info("📥 Phase 2 request received")
-        logger.info(f"HMO: {request.hmo}, Tier: {request.tier}, Lang: {request.lang}")
-        logger.info(f"User question: {request.question}")
+        hmo_norm, tier_norm = normalize_hmo_tier(hmo, tier)
+    except ValueError:
+        return
+    get_query_log().record(question, hmo_norm, tier_norm, lang.lower())
+
+
+async def leave_on_disconnect(http_request: Request, deadline: Deadline) -> None:
+    """Watch for the client going away; once every client of a run has left, its deadline is cancelled."""
+    while not deadline.expired:
+        if await http_request.is_disconnected():
+            logger.info("🔌 Client disconnected during Phase 2")
+            deadline.leave()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
 
-        hmo_norm, tier_norm = normalize_hmo_tier(request.hmo, request.tier)
-        index, metadata = load_data()
-        mask = filter_by_hmo_tier(metadata, hmo_norm, tier_norm)
 
-        user_question = request.question
-        if request.lang.lower() == "english":
-            user_question = translate_to_hebrew(user_question)
-            logger.info(f"Translated to Hebrew: {user_question}")
+@app.post("/phase_2")
+async def phase_2(request: Phase2Request, http_request: Request):
+    # Every response reports the KB version the request started on (or, for answers, the one they came from)
+    version = kb_version()
+    try:
+        logger.info("📥 Phase 2 request received", extra={
+            "hmo": request.hmo, "tier": request.tier, "lang": request.lang
+        })
+        logger.info("User question", extra={"verbose": True, "question": request.question})
+        record_question(request.question, request.hmo, request.tier, request.lang)
 
-        query_vec = get_embedding(user_question)
-        top_indices = get_top_matches(index, query_vec, mask, top_k=5)
-        context_chunks = [metadata[i]["text"] for i in top_indices]
-        answer = get_answer_from_metadata(user_question, context_chunks, request.hmo, request.tier, request.lang)
+        key = (request.question.strip(), request.hmo.lower(), request.tier.lower(), request.lang.lower(), version)
 
-        return {"answer": answer}
+        async def run(deadline: Deadline):
+            return await run_in_threadpool(
+                answer_phase_2, request.hmo, request.tier, request.lang, request.question.strip(), deadline, version
+            )
 
+        # The leader of a run creates its deadline; a run whose deadline expired or was cancelled is not joined
+        future, deadline = phase2_flight.join(
+            key, run, lambda: Deadline(PHASE2_DEADLINE_SECONDS), stale=lambda deadline: deadline.expired
+        )
+        deadline.join()
+        watcher = asyncio.create_task(leave_on_disconnect(http_request, deadline))
+        try:
+            # shield: one client going away must not cancel the run the others are waiting for
+            return await asyncio.shield(future)
+        finally:
+            watcher.cancel()
+
+    except DeadlineExceeded as e:
+        logger.warning(f"⏳ Phase 2 deadline exceeded before retrieval finished: {e}")
+        return {"answer": "⏳ The request took too long. Please try again.", "degraded": True, "kb_version": version}
+    except RequestCancelled as e:
+        logger.info(f"🛑 Phase 2 cancelled: {e}")
+        return {"answer": "", "degraded": True, "kb_version": version}
     except Exception as e:
-        logger.error(f"❌ Error in Phase 2: {e}")
-        return {"answer": f"❌ Failed to generate answer: {str(e)}"}
+        logger.exception(f"❌ Error in Phase 2: {e}")
+        return {"answer": f"❌ Failed to generate answer: {str(e)}", "kb_version": version}
+
+
+@app.post("/phase_2/batch")
+async def phase_2_batch(request: Phase2BatchRequest):
+    """
+    Answer several questions for one member profile.
+    Questions answered before are served from the answer cache; the others are embedded in one request and
+    searched as one query matrix, and their answers generated concurrently. Answers are streamed back as
+    NDJSON lines, in completion order.
+    """
+    logger.info("📥 Phase 2 batch request received", extra={
+        "hmo": request.hmo, "tier": request.tier, "lang": request.lang, "questions": len(request.questions)
+    })
+
+    deadline = Deadline(PHASE2_BATCH_DEADLINE_SECONDS)
+    # Every line reports the KB version the request started on (or, for generated answers, the one they came from)
+    start_version = kb_version()
+
+    async def stream():
+        version = start_version
+        try:
+            hmo_norm, tier_norm = normalize_hmo_tier(request.hmo, request.tier)
+
+            questions = [q.strip() for q in request.questions]
+            if not questions:
+                return
+            for question in questions:
+                get_query_log().record(question, hmo_norm, tier_norm, request.lang.lower())
+
+            cached = {}
+            for i, question in enumerate(questions):
+                answer = answer_cache.get(answer_cache_key(version, hmo_norm, tier_norm, request.lang, question))
+                if answer is not None:
+                    cached[i] = answer
+            misses = [i for i in range(len(questions)) if i not in cached]
+
+            translated, contexts = {}, {}
+            if misses:
+                prepared = await asyncio.gather(
+                    *(run_in_threadpool(within, deadline, prepare_question, questions[i]) for i in misses)
+                )
+                version, found = await run_in_threadpool(
+                    within, deadline, retrieve_contexts, hmo_norm, tier_norm, prepared, 5, CONTEXT_CANDIDATES,
+                    PRIORITY_INTERACTIVE, version
+                )
+                translated = {i: text for i, (text, _) in zip(misses, prepared)}
+                contexts = dict(zip(misses, found))
+        except Exception as e:
+            logger.exception(f"❌ Error in Phase 2 batch: {e}")
+            yield json.dumps({"error": f"❌ Failed to generate answers: {str(e)}", "kb_version": version}, ensure_ascii=False) + "\n"
+            return
+
+        limit = asyncio.Semaphore(PHASE2_BATCH_CONCURRENCY)
+
+        async def answer_one(i: int) -> dict:
+            degraded = False
+            if i in cached:
+                return {"index": i, "question": request.questions[i], "answer": cached[i], "degraded": False,
+                        "kb_version": start_version}
+            async with limit:
+                try:
+                    answer, degraded = await run_in_threadpool(
+                        generate_answer, translated[i], contexts[i], request.hmo, request.tier, request.lang, deadline
+                    )
+                    if not degraded:
+                        answer_cache.put(answer_cache_key(version, hmo_norm, tier_norm, request.lang, questions[i]), answer)
+                except Exception as e:
+                    logger.exception(f"❌ Error answering batch question {i}: {e}")
+                    answer = f"❌ Failed to generate answer: {str(e)}"
+            return {"index": i, "question": request.questions[i], "answer": answer, "degraded": degraded,
+                    "kb_version": version}
+
+        try:
+            for next_done in asyncio.as_completed([answer_one(i) for i in range(len(questions))]):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+        finally:
+            # Client gone (stream closed early): stop the answers still being generated
+            deadline.cancel("stream closed")
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    # 404 rather than 401/403 so the admin surface is invisible without a valid token
+    if not ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=404)
+
+
+@app.get("/admin/stats", dependencies=[Depends(require_admin)])
+def admin_stats():
+    """Per-route chat deployment stats (latency, tokens, fallbacks) and the Azure rate limiter state."""
+    return {
+        "chat_routes": route_stats(),
+        "azure_rate_limit_rps": round(scheduler.bucket.rate, 2),
+    }
+
+
+@app.get("/admin/kb", dependencies=[Depends(require_admin)])
+def admin_kb_versions():
+    """Published KB versions (newest first) and the one being served."""
+    return {"current": kb_version(), "versions": list_kb_versions()}
+
+
+@app.post("/admin/kb/rollback", dependencies=[Depends(require_admin)])
+def admin_kb_rollback(version: str = None):
+    """Serve `version`, or the KB version published before the current one. Every process switches on its next request."""
+    try:
+        return {"current": rollback_kb(version)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/admin/startup", dependencies=[Depends(require_admin)])
+def admin_startup():
+    """How long this worker took to start: init steps and (with STARTUP_PROFILE=1) per-module import times."""
+    return startup_timer.report()
+
+
+@app.post("/admin/profile/cpu", dependencies=[Depends(require_admin)])
+async def profile_cpu(seconds: float = 10, interval_ms: float = 5):
+    """
+    Sample all threads' stacks for `seconds` while the server handles live traffic.
+    Returns folded stacks (flamegraph.pl / speedscope input).
+    """
+    try:
+        profiler.start(interval=max(interval_ms, 1) / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(min(seconds, MAX_PROFILE_SECONDS))
+    finally:
+        folded = profiler.stop()
+    logger.info("🔬 CPU profile captured", extra={"seconds": seconds, "samples": profiler.samples})
+    return PlainTextResponse(folded)
+
+
+@app.post("/admin/profile/memory", dependencies=[Depends(require_admin)])
+async def profile_memory(seconds: float = 10, limit: int = 25, frames: int = 10):
+    """
+    Trace allocations for `seconds` and report the top allocation sites (diffed against the start of the window),
+    phase 1 message-list sizes seen in the window, and the memory held by the KB (vectors, indexes, caches).
+    """
+    try:
+        memory_tracer.start(frames)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(min(seconds, MAX_PROFILE_SECONDS))
+    finally:
+        report = memory_tracer.stop(limit)
+    report["kb"] = await run_in_threadpool(kb_memory_report)
+    logger.info("🔬 Memory profile captured", extra={"seconds": seconds, "peak_bytes": report["traced_peak_bytes"]})
+    return report
@@ -1,9 +1,21 @@
 # logic/azure_calls.py
 
 import os
+import re
+import time
+import zlib
+import logging
+import threading
+import openai
+import numpy as np
+from pathlib import Path
 from dotenv import load_dotenv
 from openai import AzureOpenAI
-from typing import List, Optional
+from collections import deque
+from typing import Dict, List, Optional
+from logic.singleflight import coalesce
+from logic.deadline import current_deadline
+from logic.azure_scheduler import scheduler, DeadlineExceeded, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, AZURE_CALL_TIMEOUT
 
 # Load environment variables
 load_dotenv()
@@ -12,30 +24,261 @@ CHAT_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 CHAT_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")  
 EMBEDDING_DEPLOYMENT = os.getenv("AZURE_EMBD_DEPLOYMENT")   
 
-client = AzureOpenAI(
-    api_key=CHAT_KEY,
-    azure_endpoint=CHAT_ENDPOINT,
-    api_version="2025-01-01-preview"
-)
- 
-
-def get_chat_completion(messages: List[dict], temperature: float = 0.4, tools: Optional[List[dict]] = None, tool_choice: Optional[str] = None, return_raw: bool = False) -> str:
-    """Get a GPT chat completion, with optional tool calling."""
-    response = client.chat.completions.create(
-        model=CHAT_DEPLOYMENT, 
+_client: Optional[AzureOpenAI] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> AzureOpenAI:
+    """The shared Azure OpenAI client, created on first use (not at import, so tools that never call Azure skip it)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AzureOpenAI(
+                api_key=CHAT_KEY,
+                azure_endpoint=CHAT_ENDPOINT,
+                api_version="2025-01-01-preview",
+                max_retries=0  # retries, backoff and timeouts are handled by the scheduler
+            )
+        return _client
+
+
+# --- Chat model routing ---
+# Each kind of chat call ("route") goes to its own deployment: short, structured turns to a small
+# fast model, grounded answers to the main one. Any route setting can be overridden with
+# AZURE_ROUTE_<ROUTE>_DEPLOYMENT / _FALLBACK / _TIMEOUT.
+CHAT_FAST_DEPLOYMENT = os.getenv("AZURE_OPENAI_FAST_DEPLOYMENT") or CHAT_DEPLOYMENT
+
+# route: (deployment, fallback deployment, timeout in seconds)
+ROUTE_DEFAULTS = {
+    "translate": (CHAT_FAST_DEPLOYMENT, CHAT_DEPLOYMENT, 10.0),
+    "phase1": (CHAT_FAST_DEPLOYMENT, CHAT_DEPLOYMENT, 20.0),
+    "phase1_followup": (CHAT_FAST_DEPLOYMENT, CHAT_DEPLOYMENT, 20.0),
+    "answer": (CHAT_DEPLOYMENT, CHAT_FAST_DEPLOYMENT, AZURE_CALL_TIMEOUT),
+    "default": (CHAT_DEPLOYMENT, CHAT_FAST_DEPLOYMENT, AZURE_CALL_TIMEOUT),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class ChatRoute:
+    """Where one kind of chat call goes, plus its rolling latency / token stats."""
+
+    def __init__(self, name: str, deployment: str, fallback: Optional[str], timeout: float, window: int = 200):
+        self.name = name
+        self.deployment = deployment
+        self.fallback = fallback if fallback != deployment else None
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.stats = {"calls": 0, "errors": 0, "fallbacks": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    @classmethod
+    def from_env(cls, name: str) -> "ChatRoute":
+        deployment, fallback, timeout = ROUTE_DEFAULTS[name]
+        prefix = f"AZURE_ROUTE_{name.upper()}_"
+        return cls(
+            name,
+            os.getenv(prefix + "DEPLOYMENT") or deployment,
+            os.getenv(prefix + "FALLBACK", fallback or "") or None,
+            float(os.getenv(prefix + "TIMEOUT", str(timeout))),
+        )
+
+    def record(self, seconds: float, response=None, error: bool = False, fallback: bool = False) -> None:
+        usage = getattr(response, "usage", None)
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["errors"] += int(error)
+            self.stats["fallbacks"] += int(fallback)
+            if usage is not None:
+                self.stats["prompt_tokens"] += usage.prompt_tokens or 0
+                self.stats["completion_tokens"] += usage.completion_tokens or 0
+            if not error:
+                self.latencies.append(seconds)
+
+    def report(self) -> Dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.stats)
+
+        def pct(p: float) -> Optional[float]:
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000, 1) if latencies else None
+
+        return {
+            "deployment": self.deployment, "fallback": self.fallback, "timeout": self.timeout,
+            **stats, "p50_ms": pct(50), "p95_ms": pct(95),
+        }
+
+
+CHAT_ROUTES: Dict[str, ChatRoute] = {name: ChatRoute.from_env(name) for name in ROUTE_DEFAULTS}
+
+# Errors after which the same request is worth sending to the fallback deployment
+# (a malformed request - 400 - would fail there too); a slow primary ends in APITimeoutError once retries run out
+FALLBACK_ERRORS = (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError,
+                   openai.InternalServerError, openai.NotFoundError, DeadlineExceeded)
+
+
+def route_stats() -> Dict[str, Dict]:
+    """Per-route deployment, latency percentiles and token usage (admin stats)."""
+    return {name: route.report() for name, route in CHAT_ROUTES.items()}
+
+
+def _create_chat(deployment: str, route: ChatRoute, messages, temperature, tools, tool_choice, priority):
+    return scheduler.call(f"chat.{route.name}", lambda timeout: get_client().chat.completions.with_raw_response.create(
+        model=deployment,
         messages=messages,
         temperature=temperature,
         tools=tools,
-        tool_choice=tool_choice
-    )
+        tool_choice=tool_choice,
+        timeout=timeout
+    ), priority=priority, timeout=route.timeout)
+
+
+def get_chat_completion(messages: List[dict], temperature: float = 0.4, tools: Optional[List[dict]] = None, tool_choice: Optional[str] = None, return_raw: bool = False, priority: int = PRIORITY_INTERACTIVE, route: str = "default") -> str:
+    """
+    Get a GPT chat completion, with optional tool calling.
+    `route` picks the deployment (see CHAT_ROUTES); if it fails, the call is retried once on the route's fallback.
+    """
+    chat_route = CHAT_ROUTES[route]
+    start = time.monotonic()
+    try:
+        response = _create_chat(chat_route.deployment, chat_route, messages, temperature, tools, tool_choice, priority)
+        chat_route.record(time.monotonic() - start, response)
+    except FALLBACK_ERRORS as e:
+        deadline = current_deadline()
+        if not chat_route.fallback or (deadline is not None and deadline.expired):
+            chat_route.record(time.monotonic() - start, error=True)
+            raise
+        logger.warning(f"⚠️ Chat route '{route}' failed on {chat_route.deployment} ({type(e).__name__}); falling back to {chat_route.fallback}")
+        try:
+            response = _create_chat(chat_route.fallback, chat_route, messages, temperature, tools, tool_choice, priority)
+        except Exception:
+            chat_route.record(time.monotonic() - start, error=True, fallback=True)
+            raise
+        chat_route.record(time.monotonic() - start, response, fallback=True)
+    except Exception:
+        chat_route.record(time.monotonic() - start, error=True)
+        raise
     if return_raw:
         return response
     return response.choices[0].message.content.strip()
 
-def get_embedding(text: str) -> List[float]:
-    """Generate ADA-002 embedding for the given text."""
-    response = client.embeddings.create(
+@coalesce
+def get_embedding(text: str, priority: int = PRIORITY_INTERACTIVE) -> List[float]:
+    """Generate ADA-002 embedding for the given text (concurrent calls with the same text share one request)."""
+    response = scheduler.call("embedding", lambda timeout: get_client().embeddings.with_raw_response.create(
         input=[text],
-        model=EMBEDDING_DEPLOYMENT
-    )
+        model=EMBEDDING_DEPLOYMENT,
+        timeout=timeout
+    ), priority=priority)
     return response.data[0].embedding
+
+def get_embeddings(texts: List[str], priority: int = PRIORITY_INTERACTIVE) -> List[List[float]]:
+    """Generate ADA-002 embeddings for several texts in a single request."""
+    response = scheduler.call("embedding", lambda timeout: get_client().embeddings.with_raw_response.create(
+        input=texts,
+        model=EMBEDDING_DEPLOYMENT,
+        timeout=timeout
+    ), priority=priority)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+# --- Embedding backends ---
+# A KB is embedded with one backend and queried with the same one; the backend name and its
+# parameters are recorded in the KB manifest (see src/embd_chunks.py).
+
+class EmbeddingBackend:
+    """Interface for turning texts into vectors."""
+    name = ""
+
+    def fit(self, texts: List[str]) -> None:
+        """Learn whatever the backend needs from the KB texts (called once per KB build)."""
+
+    def embed(self, texts: List[str], priority: int = PRIORITY_INTERACTIVE) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_one(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> List[float]:
+        return self.embed([text], priority=priority)[0]
+
+    def save(self, directory: Path) -> Dict:
+        """Persist fitted state next to the KB and return the parameters to record in the manifest."""
+        return {}
+
+    def load(self, directory: Path, params: Dict) -> None:
+        """Restore the state written by save()."""
+
+
+class AzureEmbeddingBackend(EmbeddingBackend):
+    """Azure OpenAI embeddings (EMBEDDING_DEPLOYMENT)."""
+    name = "azure"
+    batch_size = 64
+
+    def embed(self, texts: List[str], priority: int = PRIORITY_INTERACTIVE) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(get_embeddings(texts[start:start + self.batch_size], priority=priority))
+        return vectors
+
+    def embed_one(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> List[float]:
+        return get_embedding(text, priority=priority)
+
+    def save(self, directory: Path) -> Dict:
+        return {"deployment": EMBEDDING_DEPLOYMENT}
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Local CPU embeddings: character n-grams hashed into a fixed number of buckets,
+    weighted by IDF learned from the KB and L2-normalized. No network calls.
+    """
+    name = "hashing"
+    idf_file = "kb_hashing_idf.npy"
+
+    def __init__(self, dim: int = 4096, ngram_range: tuple = (2, 4)):
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+        self.idf = np.ones(dim, dtype="float32")
+
+    def _buckets(self, text: str) -> Dict[int, int]:
+        text = " " + re.sub(r"\s+", " ", text.lower()).strip() + " "
+        counts: Dict[int, int] = {}
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(text) - n + 1):
+                bucket = zlib.crc32(text[i:i + n].encode("utf-8")) % self.dim
+                counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def fit(self, texts: List[str]) -> None:
+        doc_freq = np.zeros(self.dim, dtype="float32")
+        for text in texts:
+            doc_freq[list(self._buckets(text))] += 1
+        self.idf = (np.log((1 + len(texts)) / (1 + doc_freq)) + 1).astype("float32")
+
+    def embed(self, texts: List[str], priority: int = PRIORITY_INTERACTIVE) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for bucket, count in self._buckets(text).items():
+                vectors[row, bucket] = (1 + np.log(count)) * self.idf[bucket]
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        return vectors.tolist()
+
+    def save(self, directory: Path) -> Dict:
+        np.save(Path(directory) / self.idf_file, self.idf)
+        return {"dim": self.dim, "ngram_range": list(self.ngram_range), "idf_file": self.idf_file}
+
+    def load(self, directory: Path, params: Dict) -> None:
+        self.dim = params.get("dim", self.dim)
+        self.ngram_range = tuple(params.get("ngram_range", self.ngram_range))
+        self.idf = np.load(Path(directory) / params.get("idf_file", self.idf_file))
+
+
+EMBEDDING_BACKENDS = {
+    AzureEmbeddingBackend.name: AzureEmbeddingBackend,
+    HashingEmbeddingBackend.name: HashingEmbeddingBackend,
+}
+
+
+def get_embedding_backend(name: str) -> EmbeddingBackend:
+    """Create an embedding backend by name ('azure' or 'hashing')."""
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"❌ Unknown embedding backend: '{name}' (choose from {', '.join(EMBEDDING_BACKENDS)})")
+    return EMBEDDING_BACKENDS[name]()
@@ -0,0 +1,295 @@
+# logic/azure_scheduler.py
+
+import os
+import time
+import heapq
+import random
+import logging
+import threading
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional
+
+import openai
+from dotenv import load_dotenv
+from logic.deadline import DeadlineExceeded, current_deadline
+
+# Load environment variables
+load_dotenv()
+
+# Scheduler settings (override via environment variables)
+AZURE_MAX_CONCURRENCY = int(os.getenv("AZURE_MAX_CONCURRENCY", "8"))
+AZURE_MAX_RPS = float(os.getenv("AZURE_MAX_RPS", "10"))
+AZURE_MAX_RETRIES = int(os.getenv("AZURE_MAX_RETRIES", "4"))
+AZURE_CALL_TIMEOUT = float(os.getenv("AZURE_CALL_TIMEOUT", "30"))
+AZURE_BACKOFF_BASE = float(os.getenv("AZURE_BACKOFF_BASE", "0.5"))
+AZURE_BACKOFF_CAP = float(os.getenv("AZURE_BACKOFF_CAP", "10"))
+# Latency percentile after which a duplicate (hedged) request is sent; 0 disables hedging
+AZURE_HEDGE_PERCENTILE = float(os.getenv("AZURE_HEDGE_PERCENTILE", "0"))
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Request-rate limiter. The refill rate adapts to what Azure tells us:
+    it backs off on 429s / low remaining quota and creeps back up on successful calls.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, deadline: float) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            if now + wait_for > deadline:
+                raise DeadlineExceeded("rate limiter wait would exceed the call deadline")
+            time.sleep(wait_for)
+
+    def on_success(self, headers: Optional[Dict[str, str]] = None) -> None:
+        with self.lock:
+            remaining = _int_header(headers, "x-ratelimit-remaining-requests")
+            limit = _int_header(headers, "x-ratelimit-limit-requests")
+            if remaining is not None and limit and remaining < 0.1 * limit:
+                # Close to the quota window limit: slow down before Azure starts rejecting
+                self.rate = max(0.5, self.rate * 0.7)
+            else:
+                self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+    def on_throttled(self, retry_after: Optional[float]) -> None:
+        with self.lock:
+            self.rate = max(0.5, self.rate / 2)
+            self.tokens = 0
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class PriorityGate:
+    """Concurrency limit where waiting interactive calls are admitted before background calls."""
+
+    def __init__(self, slots: int):
+        self.free = slots
+        self.waiters = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def acquire(self, priority: int, deadline: float) -> None:
+        with self.lock:
+            if self.free > 0 and not self.waiters:
+                self.free -= 1
+                return
+            event = threading.Event()
+            entry = [priority, next(self.counter), event]
+            heapq.heappush(self.waiters, entry)
+        if event.wait(timeout=max(0.0, deadline - time.monotonic())):
+            return
+        with self.lock:
+            if event.is_set():  # slot handed over right as we timed out
+                return
+            self.waiters.remove(entry)
+            heapq.heapify(self.waiters)
+        raise DeadlineExceeded("no Azure call slot available before the call deadline")
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now (and nobody is queued for it)."""
+        with self.lock:
+            if self.free > 0 and not self.waiters:
+                self.free -= 1
+                return True
+            return False
+
+    def release(self) -> None:
+        with self.lock:
+            if self.waiters:
+                _, _, event = heapq.heappop(self.waiters)
+                event.set()  # the slot passes directly to the next waiter
+            else:
+                self.free += 1
+
+
+class LatencyTracker:
+    """Rolling window of call latencies, per operation."""
+
+    def __init__(self, window: int = 200):
+        self.samples: Dict[str, deque] = {}
+        self.window = window
+        self.lock = threading.Lock()
+
+    def record(self, op: str, seconds: float) -> None:
+        with self.lock:
+            self.samples.setdefault(op, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, op: str, pct: float) -> Optional[float]:
+        with self.lock:
+            samples = sorted(self.samples.get(op, ()))
+        if len(samples) < 20:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def _int_header(headers, name: str) -> Optional[int]:
+    try:
+        return int(headers.get(name)) if headers is not None and headers.get(name) is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read the server's retry hint (seconds) from an OpenAI error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class AzureScheduler:
+    """
+    Client-side scheduler for Azure OpenAI calls:
+    token bucket + priority concurrency gate, per-call deadline, jittered retries and optional hedging.
+    """
+
+    def __init__(self):
+        self.bucket = TokenBucket(AZURE_MAX_RPS)
+        self.gate = PriorityGate(AZURE_MAX_CONCURRENCY)
+        self.latency = LatencyTracker()
+        self.hedge_pool = ThreadPoolExecutor(max_workers=AZURE_MAX_CONCURRENCY, thread_name_prefix="azure-hedge")
+        # Calls made on behalf of a request with a deadline run here, so the caller can stop waiting on cancellation
+        self.call_pool = ThreadPoolExecutor(max_workers=AZURE_MAX_CONCURRENCY, thread_name_prefix="azure-call")
+
+    def call(self, op: str, fn: Callable[[float], Any], priority: int = PRIORITY_INTERACTIVE,
+             timeout: float = AZURE_CALL_TIMEOUT) -> Any:
+        """
+        Run `fn(attempt_timeout)` under the scheduler. `fn` must return the raw SDK response
+        (`.headers` + `.parse()`); the parsed response is returned.
+        Inside a request with a deadline (logic.deadline), the call gets at most the request's remaining time
+        and is abandoned as soon as the request is cancelled.
+        """
+        request_deadline = current_deadline()
+        if request_deadline is not None:
+            request_deadline.check(f"Azure {op}")
+            timeout = min(timeout, request_deadline.remaining())
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(op, fn, priority, deadline, request_deadline)
+            except RETRYABLE_ERRORS as e:
+                retry_after = _retry_after(e)
+                if isinstance(e, openai.RateLimitError):
+                    self.bucket.on_throttled(retry_after)
+                attempt += 1
+                backoff = retry_after or random.uniform(0, min(AZURE_BACKOFF_CAP, AZURE_BACKOFF_BASE * 2 ** attempt))
+                if attempt > AZURE_MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                    raise
+                logger.warning(f"⚠️ Azure {op} failed ({type(e).__name__}), retry {attempt} in {backoff:.2f}s")
+                if request_deadline is not None:
+                    request_deadline.sleep(backoff)
+                else:
+                    time.sleep(backoff)
+
+    def _attempt(self, op: str, fn: Callable[[float], Any], priority: int, deadline: float, request_deadline=None) -> Any:
+        self.bucket.acquire(deadline)
+        self.gate.acquire(priority, deadline)
+        release_slot = True
+        try:
+            if request_deadline is None:
+                return self._run(op, fn, priority, deadline)
+            future = self.call_pool.submit(self._run, op, fn, priority, deadline)
+            if not request_deadline.wait_for(future):
+                # Stop waiting; the abandoned HTTP call keeps its slot until it actually ends
+                release_slot = False
+                future.add_done_callback(lambda _: self.gate.release())
+                logger.info(f"🛑 Abandoned Azure {op} call: {request_deadline.reason or 'request deadline exceeded'}")
+                request_deadline.check(f"Azure {op}")
+                raise DeadlineExceeded(f"Azure {op}: request deadline exceeded")
+            return future.result()
+        finally:
+            if release_slot:
+                self.gate.release()
+
+    def _run(self, op: str, fn: Callable[[float], Any], priority: int, deadline: float) -> Any:
+        hedge_after = None
+        if AZURE_HEDGE_PERCENTILE and priority == PRIORITY_INTERACTIVE:
+            hedge_after = self.latency.percentile(op, AZURE_HEDGE_PERCENTILE)
+        if hedge_after is None:
+            return self._timed(op, fn, deadline)
+        return self._hedged(op, fn, deadline, hedge_after)
+
+    def _timed(self, op: str, fn: Callable[[float], Any], deadline: float) -> Any:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline exceeded before Azure {op} call")
+        start = time.monotonic()
+        raw = fn(remaining)
+        self.latency.record(op, time.monotonic() - start)
+        self.bucket.on_success(raw.headers)
+        return raw.parse()
+
+    def _hedged(self, op: str, fn: Callable[[float], Any], deadline: float, hedge_after: float) -> Any:
+        """Send the call; if it is slower than `hedge_after`, send a duplicate and take whichever finishes first."""
+        first = self.hedge_pool.submit(self._timed, op, fn, deadline)
+        done, _ = wait([first], timeout=hedge_after)
+        # The duplicate needs its own concurrency slot and rate token; without them, just keep waiting
+        if done or not self.gate.try_acquire():
+            return first.result()
+        if not self.bucket.try_acquire():
+            self.gate.release()
+            return first.result()
+        logger.info(f"🔀 Hedging slow Azure {op} call after {hedge_after:.2f}s")
+        second = self.hedge_pool.submit(self._timed, op, fn, deadline)
+        second.add_done_callback(lambda _: self.gate.release())
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+        return first.result()  # both failed: surface the original error
+
+
+scheduler = AzureScheduler()
@@ -0,0 +1,109 @@
+# logic/deadline.py
+
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import Future
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call could not complete within its deadline."""
+
+
+class RequestCancelled(Exception):
+    """Raised when the request a call belongs to was cancelled (e.g. the client disconnected)."""
+
+
+class Deadline:
+    """
+    Time budget of one request, shared by every stage working on it.
+    Stages check it before starting, bound their own timeouts by what is left, and stop waiting as soon as
+    the request is cancelled. Requests coalesced onto one pipeline run join the same deadline; it is
+    cancelled when the last of them leaves.
+    """
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+        self.cancelled = threading.Event()
+        self.reason = ""
+        self.lock = threading.Lock()
+        self.members = 0
+        self.waiters = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.cancelled.is_set() or self.remaining() <= 0
+
+    def check(self, stage: str) -> None:
+        """Raise if `stage` should not start (or continue)."""
+        if self.cancelled.is_set():
+            raise RequestCancelled(f"{stage}: request cancelled ({self.reason})")
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"{stage}: request deadline exceeded")
+
+    def cancel(self, reason: str) -> None:
+        with self.lock:
+            self.reason = reason
+            self.cancelled.set()
+            waiters, self.waiters = self.waiters, []
+        for wake in waiters:
+            wake.set()
+
+    def join(self) -> None:
+        with self.lock:
+            self.members += 1
+
+    def leave(self, reason: str = "client disconnected") -> None:
+        with self.lock:
+            self.members -= 1
+            last = self.members <= 0
+        if last:
+            self.cancel(reason)
+
+    def sleep(self, seconds: float) -> None:
+        """time.sleep that wakes up (and raises) when the request is cancelled."""
+        if self.cancelled.wait(min(seconds, self.remaining())):
+            self.check("backoff")
+
+    def wait_for(self, future: Future) -> bool:
+        """Wait for `future` until the deadline / cancellation; False if we stopped waiting first."""
+        wake = threading.Event()
+        with self.lock:
+            if self.cancelled.is_set():
+                return future.done()
+            self.waiters.append(wake)
+        future.add_done_callback(lambda _: wake.set())
+        wake.wait(self.remaining())
+        with self.lock:
+            if wake in self.waiters:
+                self.waiters.remove(wake)
+        return future.done()
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """The deadline of the request being handled on this thread / task, if any."""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """Make `deadline` the current one for the calls made inside the block."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def bounded_timeout(timeout: float) -> float:
+    """`timeout`, shortened to what is left of the current request's deadline."""
+    deadline = current_deadline()
+    return timeout if deadline is None else min(timeout, deadline.remaining())
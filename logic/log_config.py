@@ -0,0 +1,128 @@
+# logic/log_config.py
+
+import os
+import copy
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+# The settings below are read at import, possibly before any other module has loaded .env
+load_dotenv()
+
+# Logging settings (override via environment variables)
+LOG_FILE = os.getenv("LOG_FILE", "logs/chatbot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of verbose per-turn records that are kept (1.0 = keep all, 0.0 = drop all)
+LOG_VERBOSE_SAMPLE_RATE = float(os.getenv("LOG_VERBOSE_SAMPLE_RATE", "0.1"))
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "verbose"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text  # rendered by DroppingQueueHandler.prepare
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class VerboseSampler(logging.Filter):
+    """Keep only a sample of records logged with extra={"verbose": True}."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "verbose", False):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Like QueueHandler.prepare, but the traceback is rendered into exc_text (exc_info can't outlive this call)
+        rather than merged into the message, so the formatters behind the queue still see it as an exception.
+        """
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = (self.formatter or logging.Formatter()).formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        record.exc_info, record.exc_text = None, exc_text
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging() -> logging.Logger:
+    """
+    Route the root logger through an in-memory queue.
+    A background listener thread does the JSON formatting and the (rotating) file writes,
+    so request handlers only pay for a queue put.
+    """
+    global _listener
+    logger = logging.getLogger()  # Root logger
+    if _listener is not None:
+        return logger
+
+    os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(VerboseSampler(LOG_VERBOSE_SAMPLE_RATE))
+
+    # Handlers installed earlier (e.g. basicConfig's console handler) move behind the queue as well
+    existing_handlers = list(logger.handlers)
+    for handler in existing_handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, *existing_handlers, respect_handler_level=True
+    )
+    _listener.start()
+    return logger
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
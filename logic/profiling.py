@@ -0,0 +1,124 @@
+# logic/profiling.py
+
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler: a background thread snapshots every thread's stack at a fixed interval.
+    Output is the "folded stacks" format used by flamegraph.pl and speedscope.
+    Nothing runs unless a profile is in progress.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def start(self, interval: float = 0.005) -> None:
+        with self.lock:
+            if self.running:
+                raise RuntimeError("a CPU profile is already running")
+            self.stacks = Counter()
+            self.samples = 0
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, args=(interval,), name="sampling-profiler", daemon=True)
+            self.thread.start()
+
+    def stop(self) -> str:
+        with self.lock:
+            if not self.running:
+                raise RuntimeError("no CPU profile is running")
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def _run(self, interval: float) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack)).replace(" ", "_")] += 1
+            self.samples += 1
+
+
+class MemoryTracer:
+    """tracemalloc wrapper: start tracing, then diff snapshots to find the top allocation sites."""
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.message_stats = {"requests": 0, "max_messages": 0, "max_bytes": 0, "total_bytes": 0}
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10) -> None:
+        if self.running:
+            raise RuntimeError("memory tracing is already running")
+        tracemalloc.start(frames)
+        self.baseline = tracemalloc.take_snapshot()
+        self.message_stats = {"requests": 0, "max_messages": 0, "max_bytes": 0, "total_bytes": 0}
+
+    def record_messages(self, messages: List) -> None:
+        """Size of one request's chat message list (only counted while tracing)."""
+        if not self.running:
+            return
+        size = sum(sys.getsizeof(m) + sum(sys.getsizeof(v) for v in m.values()) if isinstance(m, dict) else sys.getsizeof(m)
+                   for m in messages)
+        stats = self.message_stats
+        stats["requests"] += 1
+        stats["total_bytes"] += size
+        stats["max_messages"] = max(stats["max_messages"], len(messages))
+        stats["max_bytes"] = max(stats["max_bytes"], size)
+
+    def report(self, limit: int = 25) -> Dict:
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        top = snapshot.compare_to(self.baseline, "lineno") if self.baseline else snapshot.statistics("lineno")
+        return {
+            "traced_current_bytes": current,
+            "traced_peak_bytes": peak,
+            "top_allocations": [
+                {"site": str(stat.traceback[0]), "size_bytes": stat.size,
+                 "size_diff_bytes": getattr(stat, "size_diff", stat.size), "count": stat.count}
+                for stat in top[:limit]
+            ],
+            "message_lists": dict(self.message_stats),
+        }
+
+    def stop(self, limit: int = 25) -> Dict:
+        if not self.running:
+            raise RuntimeError("memory tracing is not running")
+        result = self.report(limit)
+        tracemalloc.stop()
+        self.baseline = None
+        return result
+
+
+profiler = SamplingProfiler()
+memory_tracer = MemoryTracer()
+
@@ -0,0 +1,94 @@
+# logic/singleflight.py
+
+import asyncio
+import threading
+import functools
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from logic.deadline import DeadlineExceeded, RequestCancelled, current_deadline
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls (from different threads) that share a key.
+    The first caller runs the function; callers arriving while it is in flight wait and get the same result.
+    Nothing is cached once the call finishes.
+    Callers may belong to different requests: each waits only as long as its own deadline allows, and a call
+    that failed because of the leader's deadline (or cancellation) is run again rather than shared.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = Future()
+
+            if leader:
+                try:
+                    result, error = fn(), None
+                except BaseException as e:
+                    result, error = None, e
+                with self._lock:
+                    del self._calls[key]
+                if error is not None:
+                    call.set_exception(error)
+                    raise error
+                call.set_result(result)
+                return result
+
+            deadline = current_deadline()
+            if deadline is not None and not deadline.wait_for(call):
+                deadline.check("coalesced call")
+                raise DeadlineExceeded("coalesced call: request deadline exceeded")
+            try:
+                return call.result()
+            except (DeadlineExceeded, RequestCancelled):
+                continue  # the leader's request ran out, not ours: run it again under our own deadline
+
+
+class AsyncSingleFlight:
+    """
+    Same as SingleFlight, for coroutines running on one event loop.
+    A call can carry state created by its leader (e.g. the request deadline); callers that join the call get
+    that same state, and it goes away together with the call.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Tuple[asyncio.Future, Any]] = {}
+
+    def join(self, key: Hashable, fn: Callable[[Any], Awaitable[Any]], new_state: Callable[[], Any] = lambda: None,
+             stale: Optional[Callable[[Any], bool]] = None) -> Tuple[asyncio.Future, Any]:
+        """
+        (future, state) of the call in flight for `key`. Without one (or if `stale(state)` says it should not be
+        joined any more) the caller becomes the leader: it runs fn(new_state()).
+        """
+        entry = self._calls.get(key)
+        if entry is None or (stale is not None and stale(entry[1])):
+            state = new_state()
+            future = asyncio.ensure_future(fn(state))
+            entry = self._calls[key] = (future, state)
+            future.add_done_callback(lambda _: self._calls.pop(key) if self._calls.get(key) is entry else None)
+        return entry
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future, _ = self.join(key, lambda _: fn())
+        # shield: one waiter going away (e.g. client disconnect) must not cancel the shared call
+        return await asyncio.shield(future)
+
+
+def coalesce(func: Callable) -> Callable:
+    """Decorator: concurrent calls to `func` with equal arguments share one execution."""
+    flight = SingleFlight()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        return flight.do(key, lambda: func(*args, **kwargs))
+
+    return wrapper
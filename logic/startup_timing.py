@@ -0,0 +1,101 @@
+# logic/startup_timing.py
+
+import os
+import sys
+import time
+import logging
+import threading
+from typing import Dict, List
+
+# Time every module import of the process (a little overhead per import, so off by default)
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+
+
+class StartupTimer:
+    """
+    Startup cost report: named initialization steps (time since the previous mark) and,
+    with STARTUP_PROFILE=1, per-module import times (cumulative and self, like `python -X importtime`).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.steps: List[Dict] = []
+        self.imports: Dict[str, List[float]] = {}  # module -> [cumulative seconds, self seconds]
+        self.local = threading.local()
+        self.hooked = False
+
+    def mark(self, step: str) -> None:
+        """Record the time spent since the previous mark as `step`."""
+        now = time.perf_counter()
+        self.steps.append({"step": step, "ms": round((now - self.last_mark) * 1000, 1)})
+        self.last_mark = now
+
+    def install_import_hook(self) -> None:
+        """Time the execution of every module imported from now on (no-op unless STARTUP_PROFILE=1)."""
+        if self.hooked or not STARTUP_PROFILE:
+            return
+        self.hooked = True
+        sys.meta_path.insert(0, _TimingFinder(self))
+
+    def _timed_exec(self, name: str, exec_module, module) -> None:
+        stack = self.local.__dict__.setdefault("stack", [])
+        stack.append(0.0)  # time spent in nested imports
+        start = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.imports[name] = [elapsed, elapsed - children]
+
+    def report(self, limit: int = 15) -> Dict:
+        by_package: Dict[str, float] = {}
+        for name, (_, self_seconds) in self.imports.items():
+            package = name.split(".")[0]
+            by_package[package] = by_package.get(package, 0.0) + self_seconds
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return {
+            "total_ms": round((self.last_mark - self.started) * 1000, 1),
+            "steps": self.steps,
+            "import_ms_by_package": [
+                {"package": package, "ms": round(seconds * 1000, 1)}
+                for package, seconds in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:limit]
+            ],
+            "slowest_imports": [
+                {"module": name, "cumulative_ms": round(cumulative * 1000, 1), "self_ms": round(self_seconds * 1000, 1)}
+                for name, (cumulative, self_seconds) in slowest
+            ],
+            "modules_loaded": len(sys.modules),
+        }
+
+    def log_report(self) -> None:
+        report = self.report(limit=5)
+        logging.info(f"⏱️ Startup took {report['total_ms']} ms", extra=report)
+
+
+class _TimingFinder:
+    """Meta path finder that defers to the real finders and wraps the found loader's exec_module with a timer."""
+
+    def __init__(self, timer: StartupTimer):
+        self.timer = timer
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            loader = spec.loader
+            # Built-in / frozen importers are shared classes; only per-module loader instances are wrapped
+            if loader is not None and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+                exec_module = loader.exec_module
+                loader.exec_module = lambda module: self.timer._timed_exec(name, exec_module, module)
+            return spec
+        return None
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,219 @@
+# logic/translation.py
+
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import List, Optional
+from logic.azure_calls import get_chat_completion, PRIORITY_BACKGROUND
+from logic.singleflight import coalesce
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TRANSLATION_CACHE_PATH = Path(os.getenv("TRANSLATION_CACHE_PATH", str(BASE_DIR / "data" / "translation_cache.sqlite")))
+
+# Fixed term mapping (same one the translation prompt asks the model to use), plus tier names
+GLOSSARY_EN_HE: dict[str, str] = {
+    "medical services": "שירותי בריאות",
+    "insurance tier": "רמת ביטוח",
+    "hmo": "קופת חולים",
+    "maccabi": "מכבי",
+    "clalit": "כללית",
+    "meuhedet": "מאוחדת",
+    "gold": "זהב",
+    "silver": "כסף",
+    "bronze": "ארד",
+}
+
+# English function words that carry no meaning for retrieval once the content words are translated
+STOPWORDS_EN = {
+    "a", "an", "the", "in", "on", "at", "for", "of", "to", "with", "my", "our", "your", "is", "are",
+    "and", "or", "info", "information", "please", "tier", "plan", "level",
+}
+
+TRANSLATE_TO_HEBREW_PROMPT = """
+    You are a helpful assistant that translates English to Hebrew.
+    You will be given a question in English related to medical services in Israel.
+    Your task is to translate it to Hebrew.
+    Translate the following question from English to Hebrew. Respond with Hebrew only.\n
+    If the following words are in the text, use this mapping to transtlate them:
+    'HMO' -> 'קופת חולים', 'insurance tier' -> 'רמת ביטוח', 'medical services' -> 'שירותי בריאות', 'maccabi' -> 'מכבי', 'clalit' -> 'כללית', 'meuhedet' -> 'מאוחדת'.
+    """
+
+TRANSLATE_TO_ENGLISH_PROMPT = """
+    You translate Hebrew texts about Israeli HMO medical services to English.
+    You will be given a JSON array of Hebrew strings. Respond with a JSON array of their English translations only,
+    same length and same order, no commentary.
+    Use this mapping: 'קופת חולים' -> 'HMO', 'מכבי' -> 'Maccabi', 'כללית' -> 'Clalit', 'מאוחדת' -> 'Meuhedet',
+    'זהב' -> 'Gold', 'כסף' -> 'Silver', 'ארד' -> 'Bronze'.
+    """
+
+# Strings per LLM call when translating KB texts to English
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "20"))
+
+_HEBREW_LETTER = re.compile(r"[א-ת]")
+_LATIN_LETTER = re.compile(r"[A-Za-z]")
+_LATIN_WORD = re.compile(r"[A-Za-z]+")
+_GLOSSARY_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(term) for term in sorted(GLOSSARY_EN_HE, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+
+def detect_script(text: str) -> str:
+    """'he' if the text is mostly Hebrew letters, 'en' if mostly Latin letters, '' if it has no letters."""
+    hebrew = len(_HEBREW_LETTER.findall(text))
+    latin = len(_LATIN_LETTER.findall(text))
+    if not hebrew and not latin:
+        return ""
+    return "he" if hebrew >= latin else "en"
+
+
+def normalize_text(text: str) -> str:
+    """Cache key form: case-folded, whitespace collapsed, trailing punctuation ignored."""
+    return re.sub(r"\s+", " ", text.casefold()).strip().rstrip("?!.").strip()
+
+
+def apply_glossary(text: str) -> str:
+    """Replace glossary terms with their Hebrew form."""
+    return _GLOSSARY_PATTERN.sub(lambda m: GLOSSARY_EN_HE[m.group(0).lower()], text)
+
+
+def glossary_only_translation(text: str) -> Optional[str]:
+    """
+    Translate without the LLM when every content word is a glossary term (e.g. "maccabi gold HMO").
+    Returns None when the text needs a real translation.
+    """
+    substituted = apply_glossary(text)
+    leftover = [w for w in _LATIN_WORD.findall(substituted) if w.lower() not in STOPWORDS_EN]
+    if leftover or not _HEBREW_LETTER.search(substituted):
+        return None
+    without_stopwords = _LATIN_WORD.sub(lambda m: "" if m.group(0).lower() in STOPWORDS_EN else m.group(0), substituted)
+    return re.sub(r"\s+", " ", without_stopwords).strip()
+
+
+class TranslationCache:
+    """Persistent (sqlite) cache of translations keyed on (direction, normalized source text)."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations (direction TEXT, source TEXT, target TEXT, PRIMARY KEY (direction, source))"
+        )
+        self.conn.commit()
+
+    def get(self, direction: str, source: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT target FROM translations WHERE direction = ? AND source = ?", (direction, source)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, direction: str, source: str, target: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO translations (direction, source, target) VALUES (?, ?, ?)", (direction, source, target)
+            )
+            self.conn.commit()
+
+
+_cache: Optional[TranslationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_translation_cache() -> TranslationCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranslationCache(TRANSLATION_CACHE_PATH)
+        return _cache
+
+
+@coalesce
+def translate_to_hebrew(text: str) -> str:
+    """
+    Translate a question to Hebrew, cheapest path first:
+    already Hebrew -> as is; cached -> cached; glossary-only -> local substitution; otherwise one LLM call.
+    """
+    if detect_script(text) != "en":
+        return text
+
+    key = normalize_text(text)
+    cache = get_translation_cache()
+    cached = cache.get("en-he", key)
+    if cached is not None:
+        return cached
+
+    translated = glossary_only_translation(text)
+    if translated is None:
+        messages = [
+            {"role": "system", "content": TRANSLATE_TO_HEBREW_PROMPT},
+            {"role": "user", "content": text}
+        ]
+        translated = get_chat_completion(messages, route="translate").strip()
+    else:
+        logging.info("📖 Translated from glossary without an LLM call")
+
+    cache.put("en-he", key, translated)
+    return translated
+
+
+def _translate_batch_llm(texts: List[str]) -> List[str]:
+    messages = [
+        {"role": "system", "content": TRANSLATE_TO_ENGLISH_PROMPT},
+        {"role": "user", "content": json.dumps(texts, ensure_ascii=False)}
+    ]
+    response = get_chat_completion(messages, temperature=0, priority=PRIORITY_BACKGROUND, route="translate")
+    response = response.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    translated = json.loads(response)
+    if not isinstance(translated, list) or len(translated) != len(texts):
+        raise ValueError("translation batch came back with a different length")
+    return [str(t).strip() for t in translated]
+
+
+def _translate_one_llm(text: str) -> str:
+    messages = [
+        {"role": "system", "content": TRANSLATE_TO_ENGLISH_PROMPT + "\n    If you get a single string instead, respond with its English translation only."},
+        {"role": "user", "content": text}
+    ]
+    return get_chat_completion(messages, temperature=0, priority=PRIORITY_BACKGROUND, route="translate").strip()
+
+
+def translate_batch_to_english(texts: List[str]) -> List[str]:
+    """
+    Offline (KB build) Hebrew -> English translation: cached texts are reused, the rest are sent
+    TRANSLATION_BATCH_SIZE at a time as background-priority LLM calls.
+    """
+    cache = get_translation_cache()
+    results: List[Optional[str]] = [None] * len(texts)
+    pending: dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        if detect_script(text) != "he":
+            results[i] = text
+            continue
+        key = normalize_text(text)
+        cached = cache.get("he-en", key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.setdefault(text, []).append(i)
+
+    unique = list(pending)
+    if unique:
+        logging.info(f"🌐 Translating {len(unique)} KB texts to English ({len(texts) - sum(map(len, pending.values()))} cached)")
+    for start in range(0, len(unique), TRANSLATION_BATCH_SIZE):
+        batch = unique[start:start + TRANSLATION_BATCH_SIZE]
+        try:
+            translated = _translate_batch_llm(batch)
+        except (ValueError, json.JSONDecodeError) as e:
+            logging.warning(f"⚠️ Batch translation failed ({e}); translating one by one")
+            translated = [_translate_one_llm(text) for text in batch]
+        for text, english in zip(batch, translated):
+            cache.put("he-en", normalize_text(text), english)
+            for i in pending[text]:
+                results[i] = english
+    return results
@@ -2,11 +2,13 @@
 
 import os
 import json
+import logging
 from pathlib import Path
-from logic.azure_calls import get_chat_completion, get_embedding
-from tools import tool_descriptions, collect_hmo, collect_insurance_tier, confirm_information
+from logic.azure_calls import get_chat_completion
+from logic.translation import translate_to_hebrew
+from tools import handle_tool_call, filled_slot, phase1_tool_args
 from src.extract_data_embd import run_extraction
-from src.embd_chunks import normalize_hmo_tier, load_data, get_top_matches, get_answer_from_metadata, filter_by_hmo_tier, build_and_save_index, is_kb_ready
+from src.embd_chunks import normalize_hmo_tier, kb_version, load_data, get_top_matches, get_answer_from_metadata, filter_by_hmo_tier, build_and_save_index, is_kb_ready, build_context, embed_query, CONTEXT_CANDIDATES
 
 def load_system_prompt(language: str) -> str:
     prompt_dir = Path(__file__).resolve().parent / "prompts"
@@ -14,34 +16,6 @@ def load_system_prompt(language: str) -> str:
     with open(prompt_dir / filename, "r", encoding="utf-8") as f:
         return f.read()
 
-def translate_to_hebrew(text: str) -> str:
-    system_message = """
-    You are a helpful assistant that translates English to Hebrew. 
-    You will be given a question in English related to medical services in Israel.
-    Your task is to translate it to Hebrew.
-    Translate the following question from English to Hebrew. Respond with Hebrew only.\n
-    If the following words are in the text, use this mapping to transtlate them: 
-    'HMO' -> 'קופת חולים', 'insurance tier' -> 'רמת ביטוח', 'medical services' -> 'שירותי בריאות', 'maccabi' -> 'מכבי', 'clalit' -> 'כללית', 'meuhedet' -> 'מאוחדת'.
-    """
-
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": text}
-    ]
-    response = get_chat_completion(messages)
-    return response.strip()
-
-
-def handle_tool_call(tool_name: str, arguments: str):
-    data = json.loads(arguments)
-    if tool_name == "collect_hmo":
-        return collect_hmo(data["hmo"])
-    elif tool_name == "collect_insurance_tier":
-        return collect_insurance_tier(data["tier"])
-    elif tool_name == "confirm_information":
-        return confirm_information(data["confirmation"])
-    return "Unknown tool call."
-
 def run_phase_1(language: str):
     system_prompt = load_system_prompt(language)
     print("\n👩‍⚕️ BOT: Welcome! Let's get started collecting your information.")
@@ -49,14 +23,10 @@ def run_phase_1(language: str):
 
     messages = [{"role": "system", "content": system_prompt}]
     hmo, tier, confirmed = None, None, False
+    collected = set()
 
     # Let GPT start the conversation
-    response = get_chat_completion(
-        messages,
-        tools=tool_descriptions,
-        tool_choice="auto",
-        return_raw=True
-    )
+    response = get_chat_completion(messages, **phase1_tool_args(collected, confirmed), return_raw=True, route="phase1")
     choice = response.choices[0]
     messages.append(choice.message)
     print(f"🤖 BOT: {choice.message.content}\n")
@@ -69,12 +39,7 @@ def run_phase_1(language: str):
 
         messages.append({"role": "user", "content": user_input})
 
-        response = get_chat_completion(
-            messages,
-            tools=tool_descriptions,
-            tool_choice="auto",
-            return_raw=True
-        )
+        response = get_chat_completion(messages, **phase1_tool_args(collected, confirmed), return_raw=True, route="phase1")
         choice = response.choices[0]
 
         if choice.finish_reason == "tool_calls":
@@ -88,6 +53,9 @@ def run_phase_1(language: str):
                 print(f"[🔧] Handling tool: {tool_name} with args: {tool_args}")
 
                 result = handle_tool_call(tool_name, tool_args)
+                slot = filled_slot(tool_name, result)
+                if slot:
+                    collected.add(slot)
 
                 # ✅ Append tool result message
                 messages.append({
@@ -106,16 +74,13 @@ def run_phase_1(language: str):
 
                     if data.get("confirmed") is True :
                         confirmed = True
+                    if data.get("restart"):
+                        collected.clear()
                 except json.JSONDecodeError:
                     pass
 
             # ✅ Now call GPT *once* after all tool responses are added
-            follow_up = get_chat_completion(
-                messages,
-                tools=tool_descriptions,
-                tool_choice="auto",
-                return_raw=True
-            )
+            follow_up = get_chat_completion(messages, **phase1_tool_args(collected, confirmed), return_raw=True, route="phase1_followup")
             follow_choice = follow_up.choices[0]
 
             if follow_choice.finish_reason == "tool_calls":
@@ -151,7 +116,9 @@ def run_phase_2(hmo: str, tier: str, lang: str):
     # Normalize HMO and tier to Hebrew
     hmo_norm, tier_norm = normalize_hmo_tier(hmo, tier)
 
-    index, metadata = load_data()
+    # Questions are embedded for the KB version loaded here, even if a newer one is published meanwhile
+    version = kb_version()
+    index, metadata = load_data(version)
     mask = filter_by_hmo_tier(metadata, hmo_norm, tier_norm)
 
     while True:
@@ -164,18 +131,19 @@ def run_phase_2(hmo: str, tier: str, lang: str):
             user_question= translate_to_hebrew(user_question)  
             print(f"Translated Question: {user_question}")  
 
-        query_vec = get_embedding(user_question)
+        query_vec = embed_query(user_question, version=version)
         # print(f"\n🔍 Query Vector: {query_vec}")
 
-        top_indices = get_top_matches(index, query_vec, mask, top_k=5)
+        top_indices = get_top_matches(index, query_vec, mask, top_k=CONTEXT_CANDIDATES)
         print(f"📄 Top Indices: {top_indices}")
-        context_chunks = [metadata[i]["text"] for i in top_indices]
+        context_chunks = build_context(query_vec, top_indices, metadata, top_k=5, index=index)
 
         answer = get_answer_from_metadata(user_question, context_chunks, hmo, tier, lang)
         print(f"\n🤖 BOT: {answer}\n")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
     lang_input = input("🌐 Choose a language (English/Hebrew): ").strip().lower()
     if lang_input not in ("english", "hebrew"):
         print("⚠️ Invalid input. Defaulting to English.\n")
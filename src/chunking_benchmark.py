@@ -0,0 +1,98 @@
+# src/chunking_benchmark.py
+
+import json
+import time
+import logging
+import numpy as np
+from typing import Dict, List
+from logic.azure_calls import get_embedding_backend, PRIORITY_BACKGROUND
+from src.extract_data_embd import get_chunks_for_embedding, TABLE_CHUNKERS, HMO_MAPPING, TIERS
+from src.embd_chunks import compute_category_centroids, CONTEXT_CANDIDATES, KB_QUANTIZATION
+from src.context_assembly import estimate_tokens
+from src.vector_compression import make_index, index_nbytes
+from src.retrieval_service import ShardSnapshot
+from src.prefetch import load_opening_questions
+
+
+def benchmark_strategy(strategy: str, questions: List[str], embedding_backend: str = "hashing", top_k: int = 5,
+                       quantization: str = KB_QUANTIZATION) -> Dict:
+    """
+    Build an in-memory KB with one chunking strategy and measure it: chunk count, index size, build time,
+    per-question retrieval latency and the context tokens sent to the LLM. Retrieval goes through the same
+    shard snapshots the server uses (one per HMO over the shared index, category routing, id-filtered
+    partitions), for every HMO x tier. Nothing is written to data/.
+    """
+    chunks = get_chunks_for_embedding(strategy)
+    texts = [chunk["text"] for chunk in chunks]
+
+    start = time.perf_counter()
+    backend = get_embedding_backend(embedding_backend)
+    backend.fit(texts)
+    vectors = np.array(backend.embed(texts, priority=PRIORITY_BACKGROUND), dtype="float32")
+    embed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = make_index(vectors, quantization)
+    centroids = compute_category_centroids(vectors, chunks)
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    shards = [ShardSnapshot.in_memory(hmo, chunks, {"he": index}, {"he": centroids}) for hmo in HMO_MAPPING.values()]
+    for shard in shards:
+        for tier in TIERS:
+            shard.warm(tier)
+    partition_seconds = time.perf_counter() - start
+
+    query_vecs = np.array(backend.embed(questions, priority=PRIORITY_BACKGROUND), dtype="float32").tolist()
+    latencies, context_tokens, chunks_used = [], [], []
+    logging.disable(logging.INFO)  # context assembly logs every query
+    try:
+        for query_vec in query_vecs:
+            for shard in shards:
+                for tier in TIERS:
+                    start = time.perf_counter()
+                    context = shard.contexts(tier, [query_vec], top_k, CONTEXT_CANDIDATES)[0]
+                    latencies.append(time.perf_counter() - start)
+                    context_tokens.append(sum(estimate_tokens(chunk) for chunk in context))
+                    chunks_used.append(len(context))
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return {
+        "strategy": strategy,
+        "chunks": len(chunks),
+        "quantization": quantization,
+        "index_bytes": index_nbytes(index),
+        # id filters of every (hmo, tier, category) partition: what the shards hold besides the shared index
+        "partition_id_bytes": sum(8 * len(ids) for shard in shards for ids, _ in shard.partitions.values()),
+        "embed_seconds": round(embed_seconds, 3),
+        "index_build_seconds": round(index_seconds, 4),
+        "partition_build_seconds": round(partition_seconds, 4),
+        "retrieval_ms_p50": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "retrieval_ms_p95": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "context_tokens_mean": round(float(np.mean(context_tokens)), 1),
+        "context_chunks_mean": round(float(np.mean(chunks_used)), 2),
+    }
+
+
+def run_benchmark(strategies: List[str], embedding_backend: str = "hashing", quantization: str = KB_QUANTIZATION) -> List[Dict]:
+    questions = load_opening_questions().get("he", [])
+    if not questions:
+        raise ValueError("❌ No benchmark questions: data/opening_questions.json has no 'he' list")
+    results = []
+    for strategy in strategies:
+        logging.info(f"⏱️ Benchmarking '{strategy}' chunking with the '{embedding_backend}' backend...")
+        results.append(benchmark_strategy(strategy, questions, embedding_backend, quantization=quantization))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Compare chunking strategies: index size, build time, retrieval latency, prompt tokens")
+    parser.add_argument("--strategies", nargs="+", default=list(TABLE_CHUNKERS), choices=list(TABLE_CHUNKERS))
+    parser.add_argument("--embedding-backend", default="hashing", choices=["azure", "hashing"],
+                        help="'azure' embeds every strategy's chunks through the API")
+    parser.add_argument("--quantization", default=KB_QUANTIZATION, choices=["none", "float16", "int8"])
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.strategies, args.embedding_backend, args.quantization), ensure_ascii=False, indent=2))
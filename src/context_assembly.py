@@ -0,0 +1,87 @@
+# src/context_assembly.py
+
+import os
+import re
+import numpy as np
+from typing import Dict, List, Sequence
+
+# Context assembly settings (override via environment variables)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUP_THRESHOLD = float(os.getenv("CONTEXT_DUP_THRESHOLD", "0.85"))
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough GPT token estimate: ~4 chars per token for ASCII, ~1.5 for Hebrew and other scripts."""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5) + 1
+
+
+def _shingles(text: str, n: int = 4) -> set:
+    normalized = _NON_WORD.sub(" ", text).strip().lower()
+    if len(normalized) <= n:
+        return {normalized}
+    return {normalized[i:i + n] for i in range(len(normalized) - n + 1)}
+
+
+def dedupe_chunks(candidate_ids: Sequence[int], metadata: List[Dict]) -> List[int]:
+    """Drop chunks whose text is a (near) duplicate of a better-ranked chunk (character 4-gram Jaccard)."""
+    kept: List[int] = []
+    kept_shingles: List[set] = []
+    for idx in candidate_ids:
+        shingles = _shingles(metadata[idx]["text"])
+        if any(len(shingles & other) / len(shingles | other) >= CONTEXT_DUP_THRESHOLD for other in kept_shingles):
+            continue
+        kept.append(idx)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def mmr_order(query_vec, candidate_ids: Sequence[int], vectors: np.ndarray, lambda_: float = CONTEXT_MMR_LAMBDA) -> List[int]:
+    """Order candidates by Maximal Marginal Relevance: relevance to the query minus redundancy with already picked chunks."""
+    if len(candidate_ids) <= 1:
+        return list(candidate_ids)
+    cand = vectors[list(candidate_ids)].astype("float32")
+    cand /= np.linalg.norm(cand, axis=1, keepdims=True) + 1e-12
+    query = np.asarray(query_vec, dtype="float32")
+    query /= np.linalg.norm(query) + 1e-12
+
+    relevance = cand @ query
+    similarity = cand @ cand.T
+    remaining = list(range(len(candidate_ids)))
+    picked: List[int] = []
+    while remaining:
+        if picked:
+            redundancy = similarity[np.ix_(remaining, picked)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        picked.append(best)
+        remaining.remove(best)
+    return [candidate_ids[i] for i in picked]
+
+
+def assemble_context(query_vec, candidate_ids: Sequence[int], vectors: np.ndarray, metadata: List[Dict],
+                     max_chunks: int = 5, token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[str]:
+    """
+    Turn retrieval candidates (best first) into the context for the answer prompt:
+    dedupe -> MMR diversification -> keep chunks while they fit in the token budget.
+    """
+    unique_ids = dedupe_chunks(candidate_ids, metadata)
+    ordered_ids = mmr_order(query_vec, unique_ids, vectors)
+
+    chunks: List[str] = []
+    used_tokens = 0
+    for idx in ordered_ids:
+        text = metadata[idx]["text"]
+        tokens = estimate_tokens(text)
+        if used_tokens + tokens > token_budget and chunks:
+            continue  # a shorter chunk further down may still fit
+        chunks.append(text)
+        used_tokens += tokens
+        if len(chunks) >= max_chunks:
+            break
+    return chunks
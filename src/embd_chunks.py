@@ -1,48 +1,262 @@
 # src/embd_chunks.py
 
 import json
-import faiss
+import time
+import shutil
+import hashlib
+import threading
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import TYPE_CHECKING, List, Dict, Tuple
 import logging
-from dotenv import load_dotenv
 import os
-from logic.azure_calls import get_embedding, get_chat_completion
+from logic.azure_calls import get_chat_completion, get_embedding_backend, EmbeddingBackend, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from logic.cache import LRUCache
+from logic.translation import translate_batch_to_english
+from src.context_assembly import assemble_context, estimate_tokens
+from src.vector_compression import PCATransform, quantize, make_index, subset_params, index_nbytes, recall_at_k
 
-# Load environment variables
-load_dotenv()
-
-# Initialize logging
-logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+if TYPE_CHECKING:
+    import faiss  # imported where indexes are read/written, so serving processes that don't search skip it
 
 # Paths
 BASE_DIR = Path(__file__).resolve().parent.parent
 KB_PATH = BASE_DIR / "data" / "structured_kb.json"
-EMBEDDINGS_PATH = BASE_DIR / "data" / "kb_embeddings.npz"
-METADATA_PATH = BASE_DIR / "data" / "kb_metadata.json"
-FAISS_INDEX_PATH = BASE_DIR / "data" / "kb_index.faiss"
+# Every build is published as an immutable snapshot directory data/kb/<version>/; the CURRENT file names the
+# version being served and is switched atomically. KBs built before snapshots live directly in data/ ("legacy").
+KB_SNAPSHOTS_DIR = BASE_DIR / "data" / "kb"
+KB_CURRENT_PATH = KB_SNAPSHOTS_DIR / "CURRENT"
+LEGACY_KB_DIR = BASE_DIR / "data"
+
+# File names inside a KB snapshot
+EMBEDDINGS_FILE = "kb_embeddings.npz"
+METADATA_FILE = "kb_metadata.json"
+FAISS_INDEX_FILE = "kb_index.faiss"
+MANIFEST_FILE = "kb_manifest.json"
+CATEGORY_CENTROIDS_FILE = "kb_category_centroids.npz"
+# English-side vectors of a bilingual KB (same row order / chunk ids as the Hebrew ones)
+EMBEDDINGS_EN_FILE = "kb_embeddings_en.npz"
+FAISS_INDEX_EN_FILE = "kb_index_en.faiss"
+
+# Previous snapshots kept (besides the current one) for rollback
+KB_KEEP_VERSIONS = int(os.getenv("KB_KEEP_VERSIONS", "3"))
+
+# Embedding backend used for new KB builds ('azure' or 'hashing'); queries always use the KB's own backend
+KB_EMBEDDING_BACKEND = os.getenv("KB_EMBEDDING_BACKEND", "azure")
+
+# Vector compression for new KB builds: PCA output dims (0 = keep full dims) and stored/indexed precision
+KB_PCA_DIM = int(os.getenv("KB_PCA_DIM", "0"))
+KB_QUANTIZATION = os.getenv("KB_QUANTIZATION", "none")  # none | float16 | int8
+
+# Also embed an English rendering of every chunk, so English questions need no translation
+KB_BILINGUAL = os.getenv("KB_BILINGUAL", "0") == "1"
+
+# Number of retrieval candidates handed to context assembly (which keeps at most top_k of them)
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "15"))
+
+# Search indexes, metadata and query embedding state of the KB version in use, shared by every shard of the process.
+# The index is the only resident copy of the vectors, in their stored (possibly quantized) precision.
+_kb_cache: Dict[tuple, object] = {}
+_kb_cache_lock = threading.Lock()
+_current_cache = {"stamp": None, "version": None}
+_publish_lock = threading.Lock()
+
+# Query embeddings already computed for the current KB, keyed by (kb_version, text)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+_embedding_cache = LRUCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+
+def kb_version() -> str:
+    """Version of the KB being served (name of its snapshot); switches on publish / rollback and keys every cache."""
+    try:
+        stat = KB_CURRENT_PATH.stat()
+    except FileNotFoundError:
+        return "legacy"
+    # CURRENT is replaced, never rewritten: a new inode tells a switch apart even within one mtime tick
+    stamp = (stat.st_ino, stat.st_mtime_ns)
+    if _current_cache["stamp"] != stamp:
+        _current_cache["version"] = KB_CURRENT_PATH.read_text(encoding="utf-8").strip()
+        _current_cache["stamp"] = stamp
+    return _current_cache["version"]
+
+
+def kb_dir(version: str = None) -> Path:
+    """Directory holding the files of a KB version (the current one by default)."""
+    version = version or kb_version()
+    return LEGACY_KB_DIR if version == "legacy" else KB_SNAPSHOTS_DIR / version
+
 
 def is_kb_ready() -> bool:
     """Check if the knowledge base files already exist."""
-    return all(path.exists() for path in [KB_PATH, METADATA_PATH, FAISS_INDEX_PATH, EMBEDDINGS_PATH])
+    directory = kb_dir()
+    return KB_PATH.exists() and all((directory / name).exists() for name in [METADATA_FILE, FAISS_INDEX_FILE, EMBEDDINGS_FILE])
 
 
-def normalize_hmo_tier(hmo: str, tier: str) -> Tuple[str, str]:
-    """Normalize HMO and tier names to a standard format."""
+def load_manifest(version: str = None) -> Dict:
+    """Read the KB manifest. KBs built before manifests existed were embedded with Azure."""
+    path = kb_dir(version) / MANIFEST_FILE
+    if not path.exists():
+        return {"embedding_backend": "azure", "embedding_params": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _per_version(version: str, name: str, load):
+    """load(version), once per KB version; entries of other versions are dropped when a new one is loaded."""
+    version = version or kb_version()
+    with _kb_cache_lock:
+        key = (version, name)
+        if key not in _kb_cache:
+            for other in [k for k in _kb_cache if k[0] != version]:
+                del _kb_cache[other]
+            _kb_cache[key] = load(version)
+        return _kb_cache[key]
 
-    HMO_MAP: dict[str, str] = {
-        "maccabi": "מכבי", "מכבי": "מכבי",
-        "meuhedet": "מאוחדת", "מאוחדת": "מאוחדת",
-        "clalit": "כללית", "כללית": "כללית"
-    }
 
-    TIER_MAP: dict[str, str] = {
-        "gold": "זהב", "זהב": "זהב",
-        "silver": "כסף", "כסף": "כסף",
-        "bronze": "ארד", "ארד": "ארד"
+def _load_query_state(version: str) -> Dict:
+    directory = kb_dir(version)
+    manifest = load_manifest(version)
+    backend = get_embedding_backend(manifest["embedding_backend"])
+    backend.load(directory, manifest.get("embedding_params", {}))
+    compression = manifest.get("compression", {})
+    transform_file = compression.get("pca_transform_file")
+    return {
+        "version": version,
+        "backend": backend,
+        "transform": PCATransform.load(directory, transform_file) if transform_file else None,
+        "quantization": compression.get("quantization", "none"),
+        "bilingual": bool(manifest.get("bilingual")),
     }
 
+
+def _query_state(version: str = None) -> Dict:
+    """Embedding backend, PCA transform and quantization of a KB version (the current one by default)."""
+    return _per_version(version, "query_state", _load_query_state)
+
+
+def list_kb_versions() -> List[Dict]:
+    """Published KB snapshots, newest first, with their build time and whether they are being served."""
+    if not KB_SNAPSHOTS_DIR.exists():
+        return []
+    current = kb_version()
+    versions = sorted((p.name for p in KB_SNAPSHOTS_DIR.iterdir() if p.is_dir() and not p.name.startswith(".")), reverse=True)
+    return [
+        {"version": version, "built_at": load_manifest(version).get("built_at"), "current": version == current}
+        for version in versions
+    ]
+
+
+def publish_kb_version(version: str) -> None:
+    """Atomically make `version` the KB that is served; running processes switch on their next request."""
+    if not (KB_SNAPSHOTS_DIR / version / MANIFEST_FILE).exists():
+        raise ValueError(f"❌ Unknown KB version: '{version}'")
+    with _publish_lock:
+        tmp_path = KB_CURRENT_PATH.with_suffix(".tmp")
+        tmp_path.write_text(version, encoding="utf-8")
+        os.replace(tmp_path, KB_CURRENT_PATH)
+    logging.info(f"🔀 Serving KB version {version}")
+
+
+def rollback_kb(version: str = None) -> str:
+    """Switch back to `version`, or to the snapshot published before the current one. Returns the version now served."""
+    if version is None:
+        current = kb_version()
+        older = [v["version"] for v in list_kb_versions() if v["version"] < current]
+        if not older:
+            raise ValueError("❌ No previous KB version to roll back to")
+        version = older[0]
+    publish_kb_version(version)
+    return version
+
+
+def _new_version_name(digest: str) -> str:
+    """UTC build time to the millisecond plus a content digest: unique, and sorts in publish order."""
+    while True:
+        now = time.time()
+        version = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now)) + f"{int(now * 1000) % 1000:03d}-{digest}"
+        if not (KB_SNAPSHOTS_DIR / version).exists():
+            return version
+        time.sleep(0.001)
+
+
+def prune_kb_versions(keep: int = KB_KEEP_VERSIONS) -> None:
+    """Delete snapshots beyond the `keep` most recent ones before the current version (newer ones are never touched)."""
+    current = kb_version()
+    older = [v["version"] for v in list_kb_versions() if v["version"] < current]
+    for version in older[keep:]:
+        shutil.rmtree(KB_SNAPSHOTS_DIR / version, ignore_errors=True)
+        logging.info(f"🧹 Removed KB version {version}")
+
+
+def get_query_backend() -> EmbeddingBackend:
+    """The embedding backend the current KB was built with."""
+    return _query_state()["backend"]
+
+
+def kb_quantization() -> str:
+    """Precision ('none', 'float16' or 'int8') the current KB's indexes use."""
+    return _query_state()["quantization"]
+
+
+def is_bilingual_kb() -> bool:
+    """Whether the current KB also has English-side vectors."""
+    return _query_state()["bilingual"]
+
+
+def embed_query(text: str, priority: int = PRIORITY_INTERACTIVE, version: str = None) -> List[float]:
+    """
+    Embed a user question with the same backend (and PCA projection, if any) the KB vectors were built with.
+    `version` pins the KB version (default: the current one); search with the index of that same version.
+    """
+    version = version or kb_version()
+    key = (version, text)
+    cached = _embedding_cache.get(key)
+    if cached is not None:
+        return cached
+    state = _query_state(version)
+    if state["transform"]:
+        vector = state["transform"].apply([state["backend"].embed_one(text, priority=priority)])[0].tolist()
+    else:
+        vector = state["backend"].embed_one(text, priority=priority)
+    _embedding_cache.put(key, vector)
+    return vector
+
+
+def embed_queries(texts: List[str], priority: int = PRIORITY_INTERACTIVE, version: str = None) -> List[List[float]]:
+    """
+    Embed several user questions at once (one request for the Azure backend); cached ones are not re-sent.
+    A single uncached question goes through embed_query(), so concurrent identical questions share one request.
+    """
+    version = version or kb_version()
+    vectors = [_embedding_cache.get((version, text)) for text in texts]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if len(missing) == 1:
+        vectors[missing[0]] = embed_query(texts[missing[0]], priority=priority, version=version)
+    elif missing:
+        state = _query_state(version)
+        new_vectors = state["backend"].embed([texts[i] for i in missing], priority=priority)
+        if state["transform"]:
+            new_vectors = state["transform"].apply(new_vectors).tolist()
+        for i, vector in zip(missing, new_vectors):
+            vectors[i] = vector
+            _embedding_cache.put((version, texts[i]), vector)
+    return vectors
+
+
+HMO_MAP: dict[str, str] = {
+    "maccabi": "מכבי", "מכבי": "מכבי",
+    "meuhedet": "מאוחדת", "מאוחדת": "מאוחדת",
+    "clalit": "כללית", "כללית": "כללית"
+}
+
+TIER_MAP: dict[str, str] = {
+    "gold": "זהב", "זהב": "זהב",
+    "silver": "כסף", "כסף": "כסף",
+    "bronze": "ארד", "ארד": "ארד"
+}
+
+
+def normalize_hmo_tier(hmo: str, tier: str) -> Tuple[str, str]:
+    """Normalize HMO and tier names to a standard format."""
     hmo_normalized = HMO_MAP.get(hmo.lower())
     tier_normalized = TIER_MAP.get(tier.lower())
 
@@ -52,27 +266,121 @@ def normalize_hmo_tier(hmo: str, tier: str) -> Tuple[str, str]:
     return hmo_normalized, tier_normalized
 
 
-def build_faiss_index(vectors: List[List[float]]) -> faiss.IndexFlatL2:
-    """Create FAISS index from vectors  """
-    dim = len(vectors[0])
-    index = faiss.IndexFlatL2(dim)
-    index.add(np.array(vectors).astype("float32"))
-    return index
+def build_faiss_index(vectors: List[List[float]], quantization: str = "none") -> "faiss.Index":
+    """Create FAISS index from vectors (flat, or scalar-quantized to float16 / int8)"""
+    return make_index(np.array(vectors), quantization)
+
+def read_index(lang: str = "he", version: str = None) -> "faiss.Index":
+    """A private copy of the KB's FAISS index (not shared through the cache, so it may be modified)."""
+    import faiss
+    name = FAISS_INDEX_EN_FILE if lang == "en" else FAISS_INDEX_FILE
+    return faiss.read_index(str(kb_dir(version) / name))
+
+def load_index(lang: str = "he", version: str = None) -> "faiss.Index":
+    """FAISS index of the KB (Hebrew, or the English side of a bilingual KB); the current version by default."""
+    name = FAISS_INDEX_EN_FILE if lang == "en" else FAISS_INDEX_FILE
+    return _per_version(version, name, lambda v: read_index(lang, v))
+
+def read_metadata(version: str = None) -> List[Dict]:
+    """A private copy of the KB metadata (not shared through the cache)."""
+    with open(kb_dir(version) / METADATA_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_data(version: str = None):
+    """Load FAISS index and metadata (of the current KB version by default). Both are shared: don't modify them."""
+    return load_index("he", version), _per_version(version, METADATA_FILE, read_metadata)
 
-def load_data():
-    """Load FAISS index and metadata."""
-    index = faiss.read_index(str(FAISS_INDEX_PATH))
-    with open(METADATA_PATH, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
-    return index, metadata
+def compute_category_centroids(vectors: np.ndarray, chunks: List[Dict]) -> Tuple[List[str], np.ndarray]:
+    """Unit-length mean vector of each service category (used to route queries to categories)."""
+    categories = sorted({chunk.get("category") for chunk in chunks if chunk.get("category")})
+    centroids = np.stack([
+        vectors[[i for i, chunk in enumerate(chunks) if chunk.get("category") == category]].mean(axis=0)
+        for category in categories
+    ]).astype("float32")
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+    return categories, centroids
+
+def load_category_centroids(lang: str = "he", version: str = None):
+    """(categories, centroids) saved with the KB (the current one by default), or None for KBs built without them."""
+    path = kb_dir(version) / CATEGORY_CENTROIDS_FILE
+    if not load_manifest(version).get("category_centroids_file") or not path.exists():
+        return None
+    data = np.load(path, allow_pickle=False)
+    key = "centroids_en" if lang == "en" else "centroids"
+    if key not in data:
+        return None
+    return [str(c) for c in data["categories"]], data[key]
+
+CATEGORY_EN = {
+    "רפואה משלימה": "Alternative medicine",
+    "מרפאות תקשורת": "Communication clinics",
+    "מרפאות שיניים": "Dental clinics",
+    "אופטומטריה": "Optometry",
+    "הריון": "Pregnancy",
+    "סדנאות בריאות": "Health workshops",
+}
+HMO_EN = {"מכבי": "Maccabi", "מאוחדת": "Meuhedet", "כללית": "Clalit"}
+TIER_EN = {"זהב": "Gold", "כסף": "Silver", "ארד": "Bronze"}
+
+def render_chunks_in_english(chunks: List[Dict]) -> List[str]:
+    """
+    English text for every chunk. Table chunks are rebuilt from their structured fields, so only the
+    service name and benefits need translating; other chunks are translated whole. Translations are cached.
+    """
+    def benefit(chunk: Dict) -> str:
+        return chunk.get("benefit") or chunk["text"].split("הטבה:", 1)[-1].strip()
+
+    to_translate = []
+    for chunk in chunks:
+        if chunk.get("tier"):
+            to_translate += [chunk["service"], benefit(chunk)]
+        elif chunk.get("benefits"):
+            to_translate += [chunk["service"]] + [b["benefit"] for b in chunk["benefits"]]
+        else:
+            to_translate.append(chunk["text"])
+    unique = list(dict.fromkeys(to_translate))
+    english = dict(zip(unique, translate_batch_to_english(unique)))
+
+    rendered = []
+    for chunk in chunks:
+        if chunk.get("tier"):
+            category = chunk["category"]
+            rendered.append(
+                f"Category: {CATEGORY_EN.get(category, english.get(category, category))}\n"
+                f"Service: {english[chunk['service']]}\n"
+                f"HMO: {HMO_EN.get(chunk['hmo'], chunk['hmo'])}\n"
+                f"Tier: {TIER_EN.get(chunk['tier'], chunk['tier'])}\n"
+                f"Benefit: {english[benefit(chunk)]}"
+            )
+        elif chunk.get("benefits"):
+            # Multi-cell chunks ('row' / 'hmo_service' chunking)
+            category = chunk["category"]
+            lines = [
+                f"{HMO_EN.get(b['hmo'], b['hmo'])} - {TIER_EN.get(b['tier'], b['tier'])}: {english[b['benefit']]}"
+                for b in chunk["benefits"]
+            ]
+            rendered.append(
+                f"Category: {CATEGORY_EN.get(category, english.get(category, category))}\n"
+                f"Service: {english[chunk['service']]}\n" + "\n".join(lines)
+            )
+        else:
+            rendered.append(english[chunk["text"]])
+    return rendered
+
+def chunk_applies_to(chunk: Dict, hmo: str, tier: str = None) -> bool:
+    """
+    Whether a chunk is relevant to an HMO (and tier). Chunks name a single "hmo" / "tier",
+    or list the ones they cover in "hmos" / "tiers" (multi-cell chunking); chunks with neither apply to everyone.
+    """
+    if chunk.get("hmo") not in (None, hmo) or hmo not in chunk.get("hmos", [hmo]):
+        return False
+    return tier is None or (chunk.get("tier") in (None, tier) and tier in chunk.get("tiers", [tier]))
 
 def filter_by_hmo_tier(metadata: List[Dict], hmo: str, tier: str) -> List[int]:
     """ Filter metadata by HMO and tier."""
     filtered_indices = []
     for i, chunk in enumerate(metadata):
-        hmo_val = chunk.get("hmo")
-        tier_val = chunk.get("tier")
-        if (hmo_val is None or hmo_val == hmo) and (tier_val is None or tier_val == tier):
+        if chunk_applies_to(chunk, hmo, tier):
             filtered_indices.append(i)
     
     return filtered_indices
@@ -84,16 +392,29 @@ def get_top_matches(index, query_vec, mask_indices, top_k=5) -> List[int]:
     - D: the corresponding distances 
     """
 
-    if mask_indices:
-        all_vecs = np.load(EMBEDDINGS_PATH)["vectors"]
-        vectors_to_search = all_vecs[mask_indices]
-        local_index = faiss.IndexFlatL2(all_vecs.shape[1])
-        local_index.add(vectors_to_search.astype("float32"))
-        D, I = local_index.search(np.array([query_vec]).astype("float32"), top_k)
-        return [mask_indices[i] for i in I[0]]
-    else:
-        D, I = index.search(np.array([query_vec]).astype("float32"), top_k)
-        return I[0]
+    params = subset_params(mask_indices) if mask_indices else None
+    D, I = index.search(np.array([query_vec]).astype("float32"), top_k, params=params)
+    return [int(i) for i in I[0] if i >= 0]
+
+def build_context(query_vec, candidate_ids, metadata: List[Dict], top_k: int = 5, index: "faiss.Index" = None) -> List[str]:
+    """
+    Dedupe, diversify and budget the retrieved candidates into at most top_k context chunks.
+    `index` is the one the candidates were found in (defaults to the current KB's); only the candidates' vectors are decoded.
+    """
+    candidate_ids = [int(i) for i in candidate_ids if i >= 0]
+    index = load_index() if index is None else index
+    vectors = index.reconstruct_batch(np.array(candidate_ids, dtype="int64")) if candidate_ids else np.zeros((0, index.d), dtype="float32")
+    candidates = [metadata[i] for i in candidate_ids]
+    chunks = assemble_context(query_vec, list(range(len(candidate_ids))), vectors, candidates, max_chunks=top_k)
+
+    naive_tokens = sum(estimate_tokens(metadata[i]["text"]) for i in candidate_ids[:top_k])
+    logging.info("🧩 Context assembled", extra={
+        "candidates": len(candidate_ids),
+        "chunks": len(chunks),
+        "context_tokens_before": naive_tokens,
+        "context_tokens_after": sum(estimate_tokens(chunk) for chunk in chunks),
+    })
+    return chunks
 
 def get_answer_from_metadata(question: str, context_chunks: List[str], hmo: str, tier: str, language: str) -> str:
     """Ask GPT using retrieved context chunks and user question."""
@@ -109,36 +430,124 @@ def get_answer_from_metadata(question: str, context_chunks: List[str], hmo: str,
     )
 
     messages = [{"role": "user", "content": prompt}]
-    return get_chat_completion(messages, temperature=0.3)
+    return get_chat_completion(messages, temperature=0.3, route="answer")
 
-def build_and_save_index():
+def build_and_save_index(embedding_backend: str = KB_EMBEDDING_BACKEND, pca_dim: int = KB_PCA_DIM, quantization: str = KB_QUANTIZATION,
+                         bilingual: bool = KB_BILINGUAL):
     """
     Main pipeline: load "structured_kb.json", read structured data, create embeddings.
-    Save embeddings to kb_embeddings.npz, FAISS index to kb_index.faiss, metadata to kb_meta_data.json.
+    Save embeddings to kb_embeddings.npz, FAISS index to kb_index.faiss, metadata to kb_meta_data.json,
+    and the embedding backend / compression settings to kb_manifest.json.
+    Optionally reduce vectors with PCA (pca_dim) and store/index them as float16 or int8.
+    With bilingual=True, an English rendering of each chunk is embedded too (kb_embeddings_en.npz / kb_index_en.faiss).
+    All files go to a new snapshot data/kb/<version>/, which is published (served) once complete; returns the version.
     """
+    import faiss
+
     # load all chunks from the knowledge base- structured_kb.json
     with open(KB_PATH, "r", encoding="utf-8") as f:
         chunks = json.load(f)
 
-    logging.info(f"Generating embeddings for {len(chunks)} chunks...")
+    logging.info(f"Generating embeddings for {len(chunks)} chunks with the '{embedding_backend}' backend...")
 
     # list of texts to embed
-    texts = [chunk["text"] for chunk in chunks]\
+    texts = [chunk["text"] for chunk in chunks]
     # Get embeddings for each text chunk
-    vectors = [get_embedding(text) for text in texts]
+    texts_en = render_chunks_in_english(chunks) if bilingual else []
+    backend = get_embedding_backend(embedding_backend)
+    backend.fit(texts + texts_en)
+    raw_vectors = np.array(backend.embed(texts, priority=PRIORITY_BACKGROUND), dtype="float32")
+    raw_vectors_en = np.array(backend.embed(texts_en, priority=PRIORITY_BACKGROUND), dtype="float32") if bilingual else None
+
+    # Compress: PCA projection (applied to queries as well) + scalar quantization
+    transform = PCATransform.fit(np.vstack([raw_vectors, raw_vectors_en]) if bilingual else raw_vectors, pca_dim) if pca_dim else None
+    vectors = transform.apply(raw_vectors) if transform else raw_vectors
+
+    # Write the snapshot into a hidden staging directory; it only gets its version name once every file is in place
+    with open(KB_PATH, "rb") as f:
+        version = _new_version_name(hashlib.sha1(f.read()).hexdigest()[:8])
+    staging = KB_SNAPSHOTS_DIR / f".{version}.building"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
 
     # Save embeddings
-    np.savez_compressed(EMBEDDINGS_PATH, vectors=np.array(vectors))
+    np.savez_compressed(staging / EMBEDDINGS_FILE, **quantize(vectors, quantization))
+
+    # English side: same rows, so search hits map back to the same chunk ids
+    if bilingual:
+        vectors_en = transform.apply(raw_vectors_en) if transform else raw_vectors_en
+        np.savez_compressed(staging / EMBEDDINGS_EN_FILE, **quantize(vectors_en, quantization))
+        faiss.write_index(build_faiss_index(vectors_en, quantization), str(staging / FAISS_INDEX_EN_FILE))
+        for chunk, text_en in zip(chunks, texts_en):
+            chunk["text_en"] = text_en
 
     # Save metadata
-    with open(METADATA_PATH, "w", encoding="utf-8") as f:
+    with open(staging / METADATA_FILE, "w", encoding="utf-8") as f:
         json.dump(chunks, f, ensure_ascii=False, indent=2)
 
     # Build and save FAISS index
-    index = build_faiss_index(vectors)
-    faiss.write_index(index, str(FAISS_INDEX_PATH))
+    index = build_faiss_index(vectors, quantization)
+    faiss.write_index(index, str(staging / FAISS_INDEX_FILE))
+
+    # Per-category centroids for category-first retrieval
+    categories, centroids = compute_category_centroids(vectors, chunks)
+    centroid_arrays = {"categories": np.array(categories), "centroids": centroids}
+    if bilingual:
+        centroid_arrays["centroids_en"] = compute_category_centroids(vectors_en, chunks)[1]
+    np.savez(staging / CATEGORY_CENTROIDS_FILE, **centroid_arrays)
+
+    compression = {"pca_dim": vectors.shape[1] if transform else 0, "quantization": quantization}
+    if transform:
+        compression["pca_transform_file"] = transform.save(staging)
+    if transform or quantization != "none":
+        compression["report"] = {
+            "index_bytes": index_nbytes(index),
+            "baseline_index_bytes": index_nbytes(build_faiss_index(raw_vectors)),
+            "embeddings_file_bytes": (staging / EMBEDDINGS_FILE).stat().st_size,
+            "recall_at_10_vs_baseline": round(recall_at_k(raw_vectors, index, transform, k=10), 4),
+        }
+        logging.info(f"📉 Compression report: {compression['report']}")
+
+    # Save manifest
+    manifest = {
+        "version": version,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "chunks": len(chunks),
+        "dim": int(vectors.shape[1]),
+        "embedding_backend": backend.name,
+        "embedding_params": backend.save(staging),
+        "compression": compression,
+        "category_centroids_file": CATEGORY_CENTROIDS_FILE,
+        "bilingual": bilingual,
+    }
+    with open(staging / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    # Blue/green switch: the complete snapshot appears under its name, then CURRENT is pointed at it
+    os.rename(staging, KB_SNAPSHOTS_DIR / version)
+    publish_kb_version(version)
+    prune_kb_versions()
 
-    logging.info("✅ Embeddings, metadata, and FAISS index saved.")
+    logging.info(f"✅ Embeddings, metadata, FAISS index and manifest saved as KB version {version}.")
+    return version
 
 if __name__ == "__main__":
-    build_and_save_index()
+    import argparse
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Build the FAISS knowledge base from structured_kb.json")
+    parser.add_argument("--list", action="store_true", help="list the published KB versions and exit")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="VERSION",
+                        help="serve VERSION (default: the version before the current one) and exit")
+    parser.add_argument("--embedding-backend", default=KB_EMBEDDING_BACKEND, choices=["azure", "hashing"])
+    parser.add_argument("--pca-dim", type=int, default=KB_PCA_DIM, help="reduce vectors to this many dims (0 = off)")
+    parser.add_argument("--quantization", default=KB_QUANTIZATION, choices=["none", "float16", "int8"])
+    parser.add_argument("--bilingual", action="store_true", default=KB_BILINGUAL, help="also index English renderings of the chunks")
+    args = parser.parse_args()
+    if args.list:
+        print(json.dumps(list_kb_versions(), ensure_ascii=False, indent=2))
+        raise SystemExit
+    if args.rollback is not None:
+        rollback_kb(args.rollback or None)
+        raise SystemExit
+    build_and_save_index(embedding_backend=args.embedding_backend, pca_dim=args.pca_dim, quantization=args.quantization,
+                         bilingual=args.bilingual)
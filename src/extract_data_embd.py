@@ -1,15 +1,10 @@
 # src/extract_data_embd.py
 
-from bs4 import BeautifulSoup
 import json
 import os
 import logging
 from pathlib import Path
-from typing import Dict, List, Any
-
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+from typing import Callable, Dict, List, Any, Tuple
 
 
 # Map HMO column index to HMO name
@@ -22,6 +17,71 @@ HMO_MAPPING: Dict[int, str] = {
 # Map Hebrew tier names to normalized format
 TIERS: List[str] = ["זהב", "כסף", "ארד"]
 
+# How table content is split into chunks (see TABLE_CHUNKERS)
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "cell")
+
+# One parsed table row: (service name, [(hmo, tier, benefit), ...])
+TableRow = Tuple[str, List[Tuple[str, str, str]]]
+
+
+def chunk_per_cell(category: str, rows: List[TableRow]) -> List[Dict[str, Any]]:
+    """One chunk per service x HMO x tier (smallest chunks, most of them)."""
+    return [
+        {
+            "category": category,
+            "service": service_name,
+            "hmo": hmo_name,
+            "tier": tier,
+            "benefit": benefit_text,
+            "text": f"קטגוריה: {category}\nשירות: {service_name}\nקופת חולים: {hmo_name}\nמסלול: {tier}\nהטבה: {benefit_text}"
+        }
+        for service_name, cells in rows
+        for hmo_name, tier, benefit_text in cells
+    ]
+
+
+def chunk_per_row(category: str, rows: List[TableRow]) -> List[Dict[str, Any]]:
+    """One chunk per service, with every HMO and tier in it."""
+    chunks = []
+    for service_name, cells in rows:
+        lines = [f"{hmo_name} - {tier}: {benefit_text}" for hmo_name, tier, benefit_text in cells]
+        chunks.append({
+            "category": category,
+            "service": service_name,
+            "hmos": list(dict.fromkeys(hmo_name for hmo_name, _, _ in cells)),
+            "tiers": list(dict.fromkeys(tier for _, tier, _ in cells)),
+            "benefits": [{"hmo": hmo_name, "tier": tier, "benefit": benefit_text} for hmo_name, tier, benefit_text in cells],
+            "text": f"קטגוריה: {category}\nשירות: {service_name}\n" + "\n".join(lines)
+        })
+    return chunks
+
+
+def chunk_per_hmo_service(category: str, rows: List[TableRow]) -> List[Dict[str, Any]]:
+    """One chunk per (HMO, service), with all of that HMO's tiers in it."""
+    chunks = []
+    for service_name, cells in rows:
+        for hmo_name in HMO_MAPPING.values():
+            hmo_cells = [(tier, benefit_text) for hmo, tier, benefit_text in cells if hmo == hmo_name]
+            if not hmo_cells:
+                continue
+            lines = [f"{tier}: {benefit_text}" for tier, benefit_text in hmo_cells]
+            chunks.append({
+                "category": category,
+                "service": service_name,
+                "hmo": hmo_name,
+                "tiers": [tier for tier, _ in hmo_cells],
+                "benefits": [{"hmo": hmo_name, "tier": tier, "benefit": benefit_text} for tier, benefit_text in hmo_cells],
+                "text": f"קטגוריה: {category}\nשירות: {service_name}\nקופת חולים: {hmo_name}\n" + "\n".join(lines)
+            })
+    return chunks
+
+
+TABLE_CHUNKERS: Dict[str, Callable[[str, List[TableRow]], List[Dict[str, Any]]]] = {
+    "cell": chunk_per_cell,
+    "row": chunk_per_row,
+    "hmo_service": chunk_per_hmo_service,
+}
+
 def parse_html_file(file_path: str) -> str:
     """Parse an HTML file and return its content as a string."""
     with open(file_path, "r", encoding="utf-8") as f:
@@ -38,10 +98,16 @@ def load_all_html_files(directory: str) -> Dict[str, str]:
             logging.info(f"Loaded file: {file}")
     return knowledge_base
 
-def extract_chunks_from_html(html_files: Dict[str, str], file_mappings: List[tuple]) -> List[Dict[str, Any]]:
-    """Parses <p>, <ul>, and <table> tags to create chunks of relevant text, each with attached metadata."""
+def extract_chunks_from_html(html_files: Dict[str, str], file_mappings: List[tuple], strategy: str = CHUNKING_STRATEGY) -> List[Dict[str, Any]]:
+    """
+    Parses <p>, <ul>, and <table> tags to create chunks of relevant text, each with attached metadata.
+    `strategy` (a TABLE_CHUNKERS key) decides how the services table is split.
+    """
+
+    from bs4 import BeautifulSoup  # only KB builds parse HTML
 
     chunks: List[Dict[str, Any]] = []
+    table_chunker = TABLE_CHUNKERS[strategy]
 
     for filename, category in file_mappings:
         html_content = html_files.get(filename, "")
@@ -92,6 +158,7 @@ def extract_chunks_from_html(html_files: Dict[str, str], file_mappings: List[tup
             logging.warning(f"No table found in file: {filename}")
             continue
 
+        table_rows: List[TableRow] = []
         rows = table.find_all('tr')
         for row in rows:
             cols = row.find_all('td')
@@ -99,6 +166,7 @@ def extract_chunks_from_html(html_files: Dict[str, str], file_mappings: List[tup
                 continue  # Skip header row
 
             service_name = cols[0].get_text(strip=True)
+            cells = []
 
             for hmo_idx, hmo_name in HMO_MAPPING.items():
                 hmo_info = cols[hmo_idx]
@@ -112,14 +180,10 @@ def extract_chunks_from_html(html_files: Dict[str, str], file_mappings: List[tup
                         if strong_text in TIERS:
                             tier = strong_text
                             benefit_text = strong.next_sibling.strip() if strong.next_sibling else ""
-                            chunk = {
-                                "category": category,
-                                "service": service_name,
-                                "hmo": hmo_name,
-                                "tier": tier,
-                                "text": f"קטגוריה: {category}\nשירות: {service_name}\nקופת חולים: {hmo_name}\nמסלול: {tier}\nהטבה: {benefit_text}"
-                            }
-                            chunks.append(chunk)
+                            cells.append((hmo_name, tier, benefit_text))
+            table_rows.append((service_name, cells))
+
+        chunks.extend(table_chunker(category, table_rows))
 
         # Extract info under the table (contact info, websites, etc.)
         if table:
@@ -145,7 +209,7 @@ def extract_chunks_from_html(html_files: Dict[str, str], file_mappings: List[tup
     return chunks
 
 
-def get_chunks_for_embedding() -> List[Dict[str, Any]]:
+def get_chunks_for_embedding(strategy: str = CHUNKING_STRATEGY) -> List[Dict[str, Any]]:
     """Load HTML files and extract relevant chunks."""
     BASE_DIR = Path(__file__).resolve().parent.parent
     html_dir = BASE_DIR / "data" / "phase2_data"
@@ -159,18 +223,23 @@ def get_chunks_for_embedding() -> List[Dict[str, Any]]:
         ("pragrency_services", "הריון"),
         ("workshops_services", "סדנאות בריאות")
     ]
-    return extract_chunks_from_html(html_files, FILES)
+    return extract_chunks_from_html(html_files, FILES, strategy=strategy)
 
-def run_extraction():
+def run_extraction(strategy: str = CHUNKING_STRATEGY):
     """Main pipeline to extract and write output as structured_kb.json"""
     BASE_DIR = Path(__file__).resolve().parent.parent
     output_path = BASE_DIR / "data" / "structured_kb.json"
-    chunks = get_chunks_for_embedding()
+    chunks = get_chunks_for_embedding(strategy)
 
     with open(output_path, "w", encoding='utf-8') as f:
         json.dump(chunks, f, ensure_ascii=False, indent=2)
 
-    logging.info(f"✅ Extracted {len(chunks)} chunks and saved to {output_path}.")
+    logging.info(f"✅ Extracted {len(chunks)} chunks ('{strategy}' chunking) and saved to {output_path}.")
 
 if __name__ == "__main__":
-    run_extraction()
+    import argparse
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Extract KB chunks from the phase 2 HTML files into structured_kb.json")
+    parser.add_argument("--strategy", default=CHUNKING_STRATEGY, choices=list(TABLE_CHUNKERS))
+    args = parser.parse_args()
+    run_extraction(args.strategy)
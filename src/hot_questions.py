@@ -0,0 +1,177 @@
+# src/hot_questions.py
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+import numpy as np
+from pathlib import Path
+from collections import Counter
+from typing import Dict, List, Optional
+from logic.translation import normalize_text
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+QUERY_STATS_PATH = Path(os.getenv("QUERY_STATS_PATH", str(BASE_DIR / "data" / "query_stats.sqlite")))
+HOT_QUESTIONS_PATH = Path(os.getenv("HOT_QUESTIONS_PATH", str(BASE_DIR / "data" / "hot_questions.json")))
+
+# Aggregated counts are written to sqlite at most this often (seconds)
+QUERY_LOG_FLUSH_SECONDS = float(os.getenv("QUERY_LOG_FLUSH_SECONDS", "60"))
+# Longer texts are not logged: they are rarely repeated and more likely to carry personal details
+QUERY_LOG_MAX_CHARS = int(os.getenv("QUERY_LOG_MAX_CHARS", "200"))
+
+# Offline clustering: questions at least this similar (cosine) are one hot question; a cluster needs
+# HOT_QUESTION_MIN_COUNT asks in total, so one-off (possibly identifying) questions never become hot
+HOT_QUESTION_SIMILARITY = float(os.getenv("HOT_QUESTION_SIMILARITY", "0.9"))
+HOT_QUESTION_MIN_COUNT = int(os.getenv("HOT_QUESTION_MIN_COUNT", "3"))
+HOT_QUESTIONS_PER_SCOPE = int(os.getenv("HOT_QUESTIONS_PER_SCOPE", "20"))
+
+_EMAIL = re.compile(r"\S+@\S+")
+_LONG_NUMBER = re.compile(r"\d[\d\s-]{4,}\d")  # ID / card / phone numbers
+MASKS = ("<email>", "<number>")
+
+
+def deidentify(question: str) -> Optional[str]:
+    """Normalized question with contact details and long numbers masked; None if it should not be logged."""
+    text = normalize_text(question)
+    if not text or len(text) > QUERY_LOG_MAX_CHARS:
+        return None
+    text = _EMAIL.sub(MASKS[0], text)
+    return _LONG_NUMBER.sub(MASKS[1], text)
+
+
+class QueryLog:
+    """
+    De-identified phase 2 question counts per (hmo, tier, lang) scope.
+    Requests only bump an in-memory counter; totals are added to sqlite in the background.
+    `lock` guards the counter only (it is taken on the event loop); sqlite is used under `db_lock`.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.pending: Counter = Counter()
+        self.last_flush = time.monotonic()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS question_counts (question TEXT, hmo TEXT, tier TEXT, lang TEXT, count INTEGER, "
+            "last_seen TEXT, PRIMARY KEY (question, hmo, tier, lang))"
+        )
+        self.conn.commit()
+
+    def record(self, question: str, hmo: str, tier: str, lang: str) -> None:
+        text = deidentify(question)
+        if text is None:
+            return
+        with self.lock:
+            self.pending[(text, hmo, tier, lang)] += 1
+            due = time.monotonic() - self.last_flush >= QUERY_LOG_FLUSH_SECONDS
+            if due:
+                self.last_flush = time.monotonic()
+        if due:
+            threading.Thread(target=self.flush, name="query-log-flush", daemon=True).start()
+
+    def flush(self) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        if not pending:
+            return
+        today = time.strftime("%Y-%m-%d")
+        with self.db_lock:
+            self.conn.executemany(
+                "INSERT INTO question_counts (question, hmo, tier, lang, count, last_seen) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (question, hmo, tier, lang) DO UPDATE SET count = count + excluded.count, last_seen = excluded.last_seen",
+                [(*key, count, today) for key, count in pending.items()]
+            )
+            self.conn.commit()
+
+    def counts(self) -> List[tuple]:
+        """(question, hmo, tier, lang, count) rows, most asked first."""
+        self.flush()
+        with self.db_lock:
+            return self.conn.execute(
+                "SELECT question, hmo, tier, lang, count FROM question_counts ORDER BY count DESC"
+            ).fetchall()
+
+
+_query_log: Optional[QueryLog] = None
+_query_log_lock = threading.Lock()
+
+
+def get_query_log() -> QueryLog:
+    global _query_log
+    with _query_log_lock:
+        if _query_log is None:
+            _query_log = QueryLog(QUERY_STATS_PATH)
+        return _query_log
+
+
+def cluster_questions(questions: List[str], counts: List[int], vectors: np.ndarray) -> List[Dict]:
+    """
+    Greedy clustering: the most asked question not yet assigned starts a cluster and takes every unassigned
+    question within HOT_QUESTION_SIMILARITY of it. Returns clusters (representative, total count, variants), largest first.
+    """
+    vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+    order = np.argsort(-np.array(counts))
+    assigned = np.zeros(len(questions), dtype=bool)
+    clusters = []
+    for i in order:
+        if assigned[i]:
+            continue
+        members = np.where(~assigned & (vectors @ vectors[i] >= HOT_QUESTION_SIMILARITY))[0]
+        assigned[members] = True
+        clusters.append({
+            "question": questions[i],
+            "count": int(sum(counts[j] for j in members)),
+            "variants": len(members),
+        })
+    return sorted(clusters, key=lambda cluster: cluster["count"], reverse=True)
+
+
+def build_hot_questions(per_scope: int = HOT_QUESTIONS_PER_SCOPE) -> Dict:
+    """Offline job: cluster the logged questions of every scope into its top hot questions (hot_questions.json)."""
+    from logic.azure_calls import PRIORITY_BACKGROUND
+    from src.embd_chunks import embed_queries
+
+    scopes: Dict[tuple, List[tuple]] = {}
+    for question, hmo, tier, lang, count in get_query_log().counts():
+        scopes.setdefault((hmo, tier, lang), []).append((question, count))
+
+    result = {"built_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "scopes": []}
+    for (hmo, tier, lang), rows in scopes.items():
+        questions = [question for question, _ in rows]
+        vectors = np.array(embed_queries(questions, priority=PRIORITY_BACKGROUND), dtype="float32")
+        # Masked questions can't be replayed against the live pipeline, so they are never hot
+        clusters = [c for c in cluster_questions(questions, [count for _, count in rows], vectors)
+                    if c["count"] >= HOT_QUESTION_MIN_COUNT and not any(mask in c["question"] for mask in MASKS)][:per_scope]
+        if clusters:
+            result["scopes"].append({"hmo": hmo, "tier": tier, "lang": lang, "questions": clusters})
+
+    with open(HOT_QUESTIONS_PATH, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    logging.info(f"🔥 Wrote hot questions for {len(result['scopes'])} scopes to {HOT_QUESTIONS_PATH}")
+    return result
+
+
+def load_hot_questions(top_n: int) -> List[Dict]:
+    """[{"hmo", "tier", "lang", "questions": [...]}] with at most top_n questions per scope; [] if the job never ran."""
+    if not HOT_QUESTIONS_PATH.exists():
+        return []
+    with open(HOT_QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        scopes = json.load(f).get("scopes", [])
+    return [
+        {**scope, "questions": [q["question"] for q in scope["questions"][:top_n]]}
+        for scope in scopes
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Cluster the logged phase 2 questions into hot_questions.json")
+    parser.add_argument("--per-scope", type=int, default=HOT_QUESTIONS_PER_SCOPE)
+    args = parser.parse_args()
+    build_hot_questions(args.per_scope)
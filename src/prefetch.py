@@ -0,0 +1,50 @@
+# src/prefetch.py
+
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List
+from logic.azure_calls import PRIORITY_BACKGROUND
+from src.embd_chunks import normalize_hmo_tier
+from src.retrieval_service import get_router, prime_context_cache, prepare_question
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+OPENING_QUESTIONS_PATH = BASE_DIR / "data" / "opening_questions.json"
+
+
+def load_opening_questions() -> Dict[str, List[str]]:
+    """Most common first questions after phase 1, per UI language ('he' / 'en')."""
+    if not OPENING_QUESTIONS_PATH.exists():
+        return {}
+    with open(OPENING_QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def warm_questions(hmo_norm: str, tier_norm: str, questions: List[str]) -> None:
+    """Embed `questions` in one request and cache their retrieved contexts for (hmo, tier)."""
+    if not questions:
+        return
+    prime_context_cache(hmo_norm, tier_norm, [prepare_question(q) for q in questions], priority=PRIORITY_BACKGROUND)
+
+
+def prefetch_profile(hmo: str, tier: str, lang: str) -> None:
+    """
+    Warm everything a member's first /phase_2 question needs, right after phase 1 confirms (hmo, tier):
+    the shard's tier partition, and embeddings + retrieved contexts of the likely opening questions.
+    Runs in the background and never raises.
+    """
+    start = time.perf_counter()
+    try:
+        hmo_norm, tier_norm = normalize_hmo_tier(hmo, tier)
+        get_router().warm(hmo_norm, tier_norm)
+
+        questions = load_opening_questions().get("en" if lang.lower().startswith("en") else "he", [])
+        warm_questions(hmo_norm, tier_norm, questions)
+
+        logging.info("🔥 Prefetched phase 2 profile", extra={
+            "hmo": hmo_norm, "tier": tier_norm, "questions": len(questions),
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+    except Exception as e:
+        logging.warning(f"⚠️ Prefetch failed for ({hmo}, {tier}): {e}")
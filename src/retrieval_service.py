@@ -0,0 +1,457 @@
+# src/retrieval_service.py
+
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import threading
+import subprocess
+import httpx
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from logic.cache import LRUCache
+from logic.deadline import current_deadline, bounded_timeout
+from logic.translation import detect_script, translate_to_hebrew
+from src.vector_compression import index_nbytes, keep_only, subset_params
+from logic.azure_calls import PRIORITY_INTERACTIVE
+from src.embd_chunks import load_data, load_index, read_index, read_metadata, load_category_centroids, load_manifest, filter_by_hmo_tier, chunk_applies_to, build_context, kb_version, embed_queries, is_bilingual_kb, HMO_MAP, TIER_MAP, CONTEXT_CANDIDATES
+
+# Retrieval settings (override via environment variables)
+# local: shards live inside the API process | processes: one shard process per HMO on this node
+# remote: shards run elsewhere, addresses given in RETRIEVAL_SHARDS as {"<hmo>": "http://host:port", ...}
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "local")
+RETRIEVAL_SHARDS = os.getenv("RETRIEVAL_SHARDS", "")
+RETRIEVAL_BASE_PORT = int(os.getenv("RETRIEVAL_BASE_PORT", "8101"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "5"))
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "4096"))
+# Category-first retrieval: search only the best-matching category, plus the runner-up when it scores
+# within CATEGORY_ROUTE_MARGIN (cosine) of the best. CATEGORY_ROUTING=0 searches the whole (hmo, tier) scope.
+CATEGORY_ROUTING = os.getenv("CATEGORY_ROUTING", "1") == "1"
+CATEGORY_ROUTE_MAX = int(os.getenv("CATEGORY_ROUTE_MAX", "2"))
+CATEGORY_ROUTE_MARGIN = float(os.getenv("CATEGORY_ROUTE_MARGIN", "0.05"))
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ALL_HMOS: List[str] = sorted(set(HMO_MAP.values()))
+
+logger = logging.getLogger(__name__)
+
+
+class KBVersionMismatch(RuntimeError):
+    """A shard was asked to search with query vectors embedded for a KB version other than the one it serves."""
+
+
+class ShardSnapshot:
+    """
+    The part of one KB version an HMO needs: its own chunks plus the HMO-agnostic ones
+    (intros, service descriptions, contact info). Searches are restricted to one (tier, category) partition
+    by an id filter built on first use; queries are routed to their closest categories by the category
+    centroids built with the KB. A bilingual KB also has English-side vectors ("en") for the same chunks.
+    In-process shards search the KB's stored index and metadata, shared by all shards of the process;
+    a standalone shard (its own process) keeps only its chunks' vectors and metadata.
+    Never changes once loaded: a search that took a snapshot uses its metadata and indexes throughout.
+    """
+
+    def __init__(self, hmo: str, version: str, standalone: bool = False):
+        manifest = load_manifest(version)
+        langs = ["he", "en"] if manifest.get("bilingual") else ["he"]
+        centroids = {lang: load_category_centroids(lang, version) if CATEGORY_ROUTING else None for lang in langs}
+        if standalone:
+            metadata = read_metadata(version)
+            ids = [i for i, chunk in enumerate(metadata) if chunk_applies_to(chunk, hmo)]
+            total = len(metadata)
+            metadata = [metadata[i] for i in ids]
+            indexes = {lang: keep_only(read_index(lang, version), ids) for lang in langs}
+        else:
+            _, metadata = load_data(version)
+            total = len(metadata)
+            indexes = {lang: load_index(lang, version) for lang in langs}
+        self._attach(hmo, version, metadata, indexes, centroids, standalone)
+        logger.info(f"📦 Retrieval shard '{hmo}' loaded {len(self.ids)} of {total} chunks (KB version {version})")
+
+    @classmethod
+    def in_memory(cls, hmo: str, metadata: List[Dict], indexes: Dict, centroids: Dict, version: str = "in-memory") -> "ShardSnapshot":
+        """A snapshot over a KB that was never written to disk (e.g. the chunking benchmark's), shared like a local shard's."""
+        snapshot = cls.__new__(cls)
+        snapshot._attach(hmo, version, metadata, indexes, centroids if CATEGORY_ROUTING else dict.fromkeys(indexes), False)
+        return snapshot
+
+    def _attach(self, hmo: str, version: str, metadata: List[Dict], indexes: Dict, centroids: Dict, standalone: bool) -> None:
+        self.hmo = hmo
+        self.version = version
+        self.metadata = metadata  # the whole KB's (shared) unless standalone; ids are positions in it
+        self.ids = [i for i, chunk in enumerate(metadata) if chunk_applies_to(chunk, hmo)]
+        self.indexes = indexes
+        self.centroids = centroids
+        self.standalone = standalone
+        self.lock = threading.Lock()
+        self.partitions: Dict[tuple, tuple] = {}
+
+    def partition(self, tier: str, category: Optional[str] = None) -> tuple:
+        """(ids, search parameters restricting a search to them) for one tier (optionally one category of it) inside this shard."""
+        with self.lock:
+            key = (tier, category)
+            if key not in self.partitions:
+                ids = filter_by_hmo_tier(self.metadata, self.hmo, tier) or self.ids
+                if category is not None:
+                    ids = [i for i in ids if self.metadata[i].get("category") == category]
+                self.partitions[key] = (ids, subset_params(ids) if ids else None)
+            return self.partitions[key]
+
+    def route(self, queries: np.ndarray, lang: str = "he") -> List[List[str]]:
+        """Stage 1: per query, the category (or two, when close) whose centroid best matches it."""
+        categories, centroids = self.centroids[lang]
+        scores = (queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12)) @ centroids.T
+        routes = []
+        for row in scores:
+            order = np.argsort(-row)[:CATEGORY_ROUTE_MAX]
+            routes.append([categories[i] for i in order if row[order[0]] - row[i] <= CATEGORY_ROUTE_MARGIN])
+        return routes
+
+    def search(self, tier: str, query_vecs: List[List[float]], top_k: int, lang: str = "he") -> List[List[int]]:
+        """Nearest chunks per query, as positions in the KB metadata."""
+        queries = np.array(query_vecs, dtype="float32")
+        index = self.indexes[lang]
+        if self.centroids[lang] is None:
+            _, params = self.partition(tier)
+            D, I = index.search(queries, top_k, params=params)
+            return [[int(i) for i in row if i >= 0] for row in I]
+
+        # Stage 2: one matrix search per routed category (over every query routed to it), merged per query by distance
+        by_category: Dict[str, List[int]] = {}
+        for row, categories in enumerate(self.route(queries, lang)):
+            for category in categories:
+                by_category.setdefault(category, []).append(row)
+        hits: List[list] = [[] for _ in range(len(queries))]
+        for category, rows in by_category.items():
+            ids, params = self.partition(tier, category)
+            if not ids:
+                continue
+            D, I = index.search(queries[rows], top_k, params=params)
+            for row, distances, found in zip(rows, D, I):
+                hits[row].extend((d, int(i)) for d, i in zip(distances, found) if i >= 0)
+        return [[i for _, i in sorted(row_hits)[:top_k]] for row_hits in hits]
+
+    def warm(self, tier: str) -> None:
+        """Build the tier's search partitions ahead of its first query."""
+        self.partition(tier)
+        for centroids in self.centroids.values():
+            for category in (centroids[0] if centroids else []):
+                self.partition(tier, category)
+
+    def memory_report(self) -> Dict:
+        """Approximate memory held by this shard (admin/profiling use; serializes indexes, so not cheap)."""
+        with self.lock:
+            partitions = list(self.partitions.values())
+        return {
+            "hmo": self.hmo,
+            "kb_version": self.version,
+            "chunks": len(self.ids),
+            "metadata_json_bytes": len(json.dumps([self.metadata[i] for i in self.ids], ensure_ascii=False).encode("utf-8")),
+            # In-process shards share the whole KB's index; a standalone shard's holds only its own chunks
+            "index_bytes": {lang: index_nbytes(index) for lang, index in self.indexes.items()},
+            "standalone": self.standalone,
+            "partitions": len(partitions),
+            "partition_id_bytes": sum(8 * len(ids) for ids, _ in partitions),
+        }
+
+    def contexts(self, tier: str, query_vecs: List[List[float]], top_k: int, candidates: int, lang: str = "he") -> List[List[str]]:
+        """Search and assemble the answer context (at most top_k chunks out of `candidates`) per query."""
+        results = self.search(tier, query_vecs, candidates, lang)
+        return [
+            build_context(query_vec, hits, self.metadata, top_k=top_k, index=self.indexes[lang])
+            for query_vec, hits in zip(query_vecs, results)
+        ]
+
+
+class RetrievalShard:
+    """
+    One HMO's retrieval shard: serves the snapshot of the current KB version and switches to a new snapshot
+    when another version is published (or rolled back to).
+    """
+
+    def __init__(self, hmo: str, standalone: bool = False):
+        self.hmo = hmo
+        self.standalone = standalone
+        self.load_lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        self.snapshot = ShardSnapshot(self.hmo, kb_version(), self.standalone)
+
+    def snapshot_for(self, version: Optional[str] = None) -> ShardSnapshot:
+        """
+        The snapshot to search with query vectors embedded under `version` (None: whatever is current).
+        Raises KBVersionMismatch for any version other than the current one, whose vectors this shard can't search.
+        """
+        current = kb_version()
+        if version is not None and version != current:
+            raise KBVersionMismatch(f"query embedded for KB version {version}, shard '{self.hmo}' serves {current}")
+        snapshot = self.snapshot
+        if snapshot.version != current:
+            with self.load_lock:
+                if self.snapshot.version != current:
+                    self.snapshot = ShardSnapshot(self.hmo, current, self.standalone)
+                snapshot = self.snapshot
+        return snapshot
+
+    def contexts(self, tier: str, query_vecs: List[List[float]], top_k: int, candidates: int, lang: str = "he",
+                 version: Optional[str] = None) -> List[List[str]]:
+        return self.snapshot_for(version).contexts(tier, query_vecs, top_k, candidates, lang)
+
+    def warm(self, tier: str) -> None:
+        self.snapshot_for().warm(tier)
+
+    def memory_report(self) -> Dict:
+        return self.snapshot.memory_report()
+
+
+class RemoteShard:
+    """Client for a shard served by `python -m src.retrieval_service` (same interface as RetrievalShard.contexts)."""
+
+    def __init__(self, hmo: str, url: str):
+        self.hmo = hmo
+        self.url = url.rstrip("/")
+        self.http = httpx.Client(timeout=RETRIEVAL_TIMEOUT)
+
+    def contexts(self, tier: str, query_vecs: List[List[float]], top_k: int, candidates: int, lang: str = "he",
+                 version: Optional[str] = None) -> List[List[str]]:
+        response = self.http.post(f"{self.url}/contexts", json={
+            "tier": tier, "query_vecs": query_vecs, "top_k": top_k, "candidates": candidates, "lang": lang, "kb_version": version
+        }, timeout=bounded_timeout(RETRIEVAL_TIMEOUT))
+        if response.status_code == 409:
+            raise KBVersionMismatch(response.json().get("detail", ""))
+        response.raise_for_status()
+        return response.json()["contexts"]
+
+    def warm(self, tier: str) -> None:
+        self.http.post(f"{self.url}/warm", json={"tier": tier}).raise_for_status()
+
+    def memory_report(self) -> Dict:
+        response = self.http.get(f"{self.url}/memory")
+        response.raise_for_status()
+        return response.json()
+
+    def wait_until_ready(self, timeout: float = 120) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if self.http.get(f"{self.url}/health").status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"❌ Retrieval shard '{self.hmo}' at {self.url} did not become ready")
+
+
+class RetrievalRouter:
+    """Routes each query to the shard of its (normalized) HMO."""
+
+    def __init__(self, mode: str = RETRIEVAL_MODE):
+        self.mode = mode
+        self.shards: Dict[str, object] = {}
+        self.lock = threading.Lock()
+        self.processes: List[subprocess.Popen] = []
+
+        if mode == "remote":
+            for hmo, url in json.loads(RETRIEVAL_SHARDS).items():
+                self.shards[HMO_MAP.get(hmo.lower(), hmo)] = RemoteShard(hmo, url)
+        elif mode == "processes":
+            self._spawn_local_processes()
+        elif mode != "local":
+            raise ValueError(f"❌ Unknown RETRIEVAL_MODE: '{mode}' (choose from local, processes, remote)")
+
+    def _spawn_local_processes(self) -> None:
+        for offset, hmo in enumerate(ALL_HMOS):
+            port = RETRIEVAL_BASE_PORT + offset
+            self.processes.append(subprocess.Popen(
+                [sys.executable, "-m", "src.retrieval_service", "--hmo", hmo, "--port", str(port)],
+                cwd=str(BASE_DIR)
+            ))
+            self.shards[hmo] = RemoteShard(hmo, f"http://127.0.0.1:{port}")
+        atexit.register(self.close)
+        for shard in self.shards.values():
+            shard.wait_until_ready()
+
+    def shard_for(self, hmo: str):
+        with self.lock:
+            if hmo not in self.shards:
+                if self.mode != "local":
+                    raise ValueError(f"❌ No retrieval shard configured for HMO '{hmo}'")
+                self.shards[hmo] = RetrievalShard(hmo)
+            return self.shards[hmo]
+
+    def contexts(self, hmo: str, tier: str, query_vecs: List[List[float]], top_k: int, candidates: int,
+                 lang: str = "he", version: Optional[str] = None) -> List[List[str]]:
+        return self.shard_for(hmo).contexts(tier, query_vecs, top_k, candidates, lang, version)
+
+    def warm(self, hmo: str, tier: str) -> None:
+        self.shard_for(hmo).warm(tier)
+
+    def memory_report(self) -> List[Dict]:
+        return [shard.memory_report() for shard in list(self.shards.values())]
+
+    def reload(self) -> None:
+        """Reload in-process shards after a KB rebuild."""
+        for shard in list(self.shards.values()):
+            if isinstance(shard, RetrievalShard):
+                shard.load()
+
+    def close(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        self.processes = []
+
+
+_router: Optional[RetrievalRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> RetrievalRouter:
+    """Process-wide router, created on first use."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = RetrievalRouter()
+        return _router
+
+
+def kb_memory_report() -> Dict:
+    """Memory held by KB objects in this process: shards (or their remote reports) and retrieval caches."""
+    return {
+        "retrieval_mode": get_router().mode,
+        "shards": get_router().memory_report(),
+        "context_cache_entries": len(_context_cache),
+    }
+
+
+def prepare_question(question: str) -> Tuple[str, str]:
+    """
+    (text to search with, KB side to search). English questions go straight to the English side of a
+    bilingual KB; everything else is translated to Hebrew if needed and searched on the Hebrew side.
+    """
+    if detect_script(question) == "en" and is_bilingual_kb():
+        return question, "en"
+    return translate_to_hebrew(question), "he"
+
+
+# Assembled contexts per (kb_version, lang, hmo, tier, question, top_k, candidates)
+_context_cache = LRUCache(maxsize=CONTEXT_CACHE_SIZE)
+
+
+def retrieve_contexts(hmo: str, tier: str, prepared: List[Tuple[str, str]], top_k: int = 5,
+                      candidates: int = CONTEXT_CANDIDATES, priority: int = PRIORITY_INTERACTIVE,
+                      version: Optional[str] = None) -> Tuple[str, List[List[str]]]:
+    """
+    Embed (question, search lang) pairs from prepare_question() in one request and fetch their assembled contexts
+    from the HMO's shard, one search per KB side. Returns (KB version, contexts): queries are embedded and
+    searched under the same version (`version`, e.g. the one current when the request started, by default the
+    current one); if the shard switched to a newer one meanwhile, everything is redone once on it.
+    """
+    deadline = current_deadline()
+    for attempt in range(2):
+        version = kb_version() if attempt or version is None else version
+        if deadline is not None:
+            deadline.check("embed")
+        query_vecs = embed_queries([text for text, _ in prepared], priority=priority, version=version)
+        contexts: List[Optional[List[str]]] = [None] * len(prepared)
+        try:
+            for search_lang in {lang for _, lang in prepared}:
+                if deadline is not None:
+                    deadline.check("search")
+                rows = [i for i, (_, lang) in enumerate(prepared) if lang == search_lang]
+                found = get_router().contexts(hmo, tier, [query_vecs[i] for i in rows], top_k, candidates, search_lang, version)
+                for i, context in zip(rows, found):
+                    contexts[i] = context
+            return version, contexts
+        except KBVersionMismatch as e:
+            if attempt:
+                raise
+            logger.info(f"🔀 KB version changed during retrieval, retrying: {e}")
+
+
+def retrieve_context(hmo: str, tier: str, question: str, top_k: int = 5, candidates: int = CONTEXT_CANDIDATES,
+                     lang: str = "he", version: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    Embed a question and fetch its assembled context from the HMO's shard, reusing earlier results.
+    lang="en" searches the English side of a bilingual KB (question in English); otherwise the question is Hebrew.
+    Returns (KB version the context comes from, context); see retrieve_contexts() for `version`.
+    """
+    version = version or kb_version()
+    cached = _context_cache.get((version, lang, hmo, tier, question, top_k, candidates))
+    if cached is not None:
+        return version, cached
+    version, (context,) = retrieve_contexts(hmo, tier, [(question, lang)], top_k, candidates, version=version)
+    _context_cache.put((version, lang, hmo, tier, question, top_k, candidates), context)
+    return version, context
+
+
+def prime_context_cache(hmo: str, tier: str, prepared: List[Tuple[str, str]], top_k: int = 5,
+                        candidates: int = CONTEXT_CANDIDATES, priority: int = PRIORITY_INTERACTIVE) -> None:
+    """Retrieve contexts for many prepared questions at once and store them for retrieve_context()."""
+    version, contexts = retrieve_contexts(hmo, tier, prepared, top_k, candidates, priority)
+    for (question, lang), context in zip(prepared, contexts):
+        _context_cache.put((version, lang, hmo, tier, question, top_k, candidates), context)
+
+
+def create_shard_app(hmo: str):
+    """FastAPI app serving one HMO shard."""
+    from fastapi import FastAPI, HTTPException
+    from pydantic import BaseModel
+
+    class ContextsRequest(BaseModel):
+        tier: str
+        query_vecs: List[List[float]]
+        top_k: int = 5
+        candidates: int = 15
+        lang: str = "he"
+        kb_version: Optional[str] = None  # version the query vectors were embedded under
+
+    shard = RetrievalShard(hmo, standalone=True)
+    shard_app = FastAPI()
+
+    @shard_app.get("/health")
+    def health():
+        snapshot = shard.snapshot_for()  # switches to a newly published version ahead of the next search
+        return {"hmo": shard.hmo, "chunks": len(snapshot.ids), "kb_version": snapshot.version}
+
+    @shard_app.post("/contexts")
+    def contexts(request: ContextsRequest):
+        tier = TIER_MAP.get(request.tier.lower(), request.tier)
+        try:
+            return {"contexts": shard.contexts(tier, request.query_vecs, request.top_k, request.candidates, request.lang,
+                                               request.kb_version)}
+        except KBVersionMismatch as e:
+            raise HTTPException(status_code=409, detail=str(e))
+
+    @shard_app.post("/warm")
+    def warm(request: dict):
+        shard.warm(TIER_MAP.get(request["tier"].lower(), request["tier"]))
+        return {"hmo": shard.hmo, "tier": request["tier"]}
+
+    @shard_app.get("/memory")
+    def memory():
+        return shard.memory_report()
+
+    @shard_app.post("/reload")
+    def reload():
+        shard.load()
+        return {"hmo": shard.hmo, "chunks": len(shard.snapshot.ids), "kb_version": shard.snapshot.version}
+
+    return shard_app
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Serve the retrieval shard of one HMO")
+    parser.add_argument("--hmo", required=True, help="HMO name (e.g. maccabi / מכבי)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=RETRIEVAL_BASE_PORT)
+    args = parser.parse_args()
+
+    uvicorn.run(create_shard_app(HMO_MAP.get(args.hmo.lower(), args.hmo)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,120 @@
+# src/vector_compression.py
+
+import logging
+import numpy as np
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    import faiss  # imported lazily below: the API process only needs it when it searches locally
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+TRANSFORM_FILE = "kb_transform.npz"
+
+
+class PCATransform:
+    """Linear dimensionality reduction fit on the KB vectors; the same projection is applied to queries."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean.astype("float32")
+        self.components = components.astype("float32")  # (dim_out, dim_in)
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dim: int) -> "PCATransform":
+        max_dim = min(vectors.shape)
+        if dim > max_dim:
+            logging.warning(f"⚠️ PCA dim {dim} > rank limit {max_dim} of the KB; using {max_dim}")
+            dim = max_dim
+        mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        return cls(mean, vt[:dim])
+
+    def apply(self, vectors) -> np.ndarray:
+        return (np.asarray(vectors, dtype="float32") - self.mean) @ self.components.T
+
+    def save(self, directory: Path) -> str:
+        np.savez(Path(directory) / TRANSFORM_FILE, mean=self.mean, components=self.components)
+        return TRANSFORM_FILE
+
+    @classmethod
+    def load(cls, directory: Path, filename: str = TRANSFORM_FILE) -> "PCATransform":
+        data = np.load(Path(directory) / filename)
+        return cls(data["mean"], data["components"])
+
+
+def quantize(vectors: np.ndarray, mode: str) -> Dict[str, np.ndarray]:
+    """Encode vectors for storage in kb_embeddings.npz (arrays to pass to np.savez_compressed)."""
+    vectors = np.asarray(vectors, dtype="float32")
+    if mode == "float16":
+        return {"vectors": vectors.astype("float16")}
+    if mode == "int8":
+        # Per-dimension affine scalar quantization to 256 levels
+        low = vectors.min(axis=0)
+        scale = np.maximum(vectors.max(axis=0) - low, 1e-12) / 255
+        codes = np.round((vectors - low) / scale) - 128
+        return {"vectors": codes.astype("int8"), "q_low": low, "q_scale": scale.astype("float32")}
+    return {"vectors": vectors}
+
+
+def dequantize(stored) -> np.ndarray:
+    """Inverse of quantize() for an opened kb_embeddings.npz."""
+    vectors = stored["vectors"]
+    if "q_scale" in stored:
+        return ((vectors.astype("float32") + 128) * stored["q_scale"] + stored["q_low"]).astype("float32")
+    return vectors.astype("float32")
+
+
+def make_index(vectors: np.ndarray, quantization: str = "none") -> "faiss.Index":
+    """L2 index over `vectors`; with quantization the index itself stores fp16 / 8-bit codes."""
+    import faiss
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    dim = vectors.shape[1]
+    if quantization == "none":
+        index = faiss.IndexFlatL2(dim)
+    else:
+        qtype = faiss.ScalarQuantizer.QT_fp16 if quantization == "float16" else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def subset_params(ids) -> "faiss.SearchParameters":
+    """Search parameters restricting a search to the given ids of an index (no separate index is built)."""
+    import faiss
+    return faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.asarray(ids, dtype="int64")))
+
+
+def keep_only(index: "faiss.Index", ids) -> "faiss.Index":
+    """Drop every vector of `index` except `ids` (ascending), in place: vector ids[j] becomes vector j."""
+    keep = np.zeros(index.ntotal, dtype=bool)
+    keep[np.asarray(ids, dtype="int64")] = True
+    index.remove_ids(np.where(~keep)[0].astype("int64"))
+    return index
+
+
+def index_nbytes(index: "faiss.Index") -> int:
+    """Serialized size of a FAISS index (≈ its memory footprint)."""
+    import faiss
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def recall_at_k(original: np.ndarray, index: "faiss.Index", transform: Optional[PCATransform],
+                k: int = 10, sample: int = 200, seed: int = 0) -> float:
+    """
+    Recall@k of the compressed index against exact search on the uncompressed vectors,
+    using (slightly perturbed) KB vectors as queries.
+    """
+    import faiss
+    original = np.asarray(original, dtype="float32")
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(original), size=min(sample, len(original)), replace=False)
+    noise = rng.normal(scale=original.std() * 0.1, size=(len(rows), original.shape[1])).astype("float32")
+    queries = original[rows] + noise
+
+    exact = faiss.IndexFlatL2(original.shape[1])
+    exact.add(original)
+    k = min(k, len(original))
+    _, expected = exact.search(queries, k)
+    _, found = index.search(transform.apply(queries) if transform else queries, k)
+    return float(np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)]))
@@ -0,0 +1,68 @@
+# tests/conftest.py
+
+import os
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Clients are created lazily and never called in these tests; the modules only need the settings to exist
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.invalid")
+# Importing chat_api sets up file logging, and the query log / translation cache are sqlite files; keep them out of the source tree
+TMP_DIR = Path(tempfile.mkdtemp(prefix="chatbot-tests-"))
+os.environ.setdefault("LOG_FILE", str(TMP_DIR / "chatbot.log"))
+os.environ.setdefault("QUERY_STATS_PATH", str(TMP_DIR / "query_stats.sqlite"))
+os.environ.setdefault("HOT_QUESTIONS_PATH", str(TMP_DIR / "hot_questions.json"))
+os.environ.setdefault("TRANSLATION_CACHE_PATH", str(TMP_DIR / "translation_cache.sqlite"))
+
+CATEGORIES = ["רפואה משלימה", "מרפאות שיניים", "אופטומטריה"]
+SERVICES = {
+    "רפואה משלימה": ["דיקור סיני", "שיאצו", "רפלקסולוגיה"],
+    "מרפאות שיניים": ["טיפול שורש", "הלבנת שיניים", "כתרים"],
+    "אופטומטריה": ["משקפיים", "עדשות מגע", "בדיקת ראייה"],
+}
+
+
+def tiny_kb():
+    """A few chunks per (hmo, tier, category), shaped like structured_kb.json."""
+    chunks = []
+    for hmo in ["מכבי", "מאוחדת"]:
+        for tier in ["זהב", "כסף"]:
+            for category, services in SERVICES.items():
+                for service in services:
+                    chunks.append({
+                        "text": f"{service} ב{hmo} במסלול {tier}: הנחה של {len(chunks) % 7 * 10}%",
+                        "hmo": hmo, "tier": tier, "category": category, "service": service,
+                    })
+    for category in CATEGORIES:
+        chunks.append({"text": f"מידע כללי על {category}", "category": category})
+    return chunks
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    """embd_chunks pointed at a temporary data/ directory holding tiny_kb() (not built yet)."""
+    import src.embd_chunks as embd_chunks
+
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "structured_kb.json").write_text(json.dumps(tiny_kb(), ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(embd_chunks, "KB_PATH", data / "structured_kb.json")
+    monkeypatch.setattr(embd_chunks, "LEGACY_KB_DIR", data)
+    monkeypatch.setattr(embd_chunks, "KB_SNAPSHOTS_DIR", data / "kb")
+    monkeypatch.setattr(embd_chunks, "KB_CURRENT_PATH", data / "kb" / "CURRENT")
+    monkeypatch.setattr(embd_chunks, "_current_cache", {"stamp": None, "version": None})
+    monkeypatch.setattr(embd_chunks, "_kb_cache", {})
+    return embd_chunks
+
+
+@pytest.fixture
+def build(kb):
+    """build() publishes a new hashing-backend snapshot of the tiny KB and returns its version."""
+    def build(**kwargs):
+        return kb.build_and_save_index(embedding_backend="hashing", **kwargs)
+    return build
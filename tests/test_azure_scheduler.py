@@ -0,0 +1,82 @@
+# tests/test_azure_scheduler.py
+
+import time
+
+import pytest
+
+from logic.azure_scheduler import AzureScheduler, PriorityGate, TokenBucket, PRIORITY_INTERACTIVE
+from logic.deadline import DeadlineExceeded
+
+
+def test_burst_up_to_capacity_then_wait():
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    start = time.monotonic()
+    bucket.acquire(deadline=time.monotonic() + 2)
+    assert 0.3 < time.monotonic() - start < 1
+
+
+def test_acquire_gives_up_when_wait_exceeds_deadline():
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.acquire(deadline=time.monotonic() + 1)
+    with pytest.raises(DeadlineExceeded):
+        bucket.acquire(deadline=time.monotonic() + 0.2)
+
+
+def test_throttling_halves_rate_and_honours_retry_after():
+    bucket = TokenBucket(rate=10)
+    bucket.on_throttled(retry_after=0.5)
+    assert bucket.rate == 5 and bucket.tokens == 0
+    time.sleep(0.3)
+    assert not bucket.try_acquire()  # tokens refilled, but still blocked
+    time.sleep(0.3)
+    assert bucket.try_acquire()
+
+
+def test_rate_follows_quota_headers():
+    bucket = TokenBucket(rate=10)
+    bucket.on_success({"x-ratelimit-remaining-requests": "5", "x-ratelimit-limit-requests": "100"})
+    assert bucket.rate == pytest.approx(7)
+    bucket.on_success({"x-ratelimit-remaining-requests": "90", "x-ratelimit-limit-requests": "100"})
+    assert bucket.rate == pytest.approx(8)
+    for _ in range(5):
+        bucket.on_success()
+    assert bucket.rate == 10
+
+
+class Raw:
+    headers = {}
+
+    def __init__(self, value):
+        self.value = value
+
+    def parse(self):
+        return self.value
+
+
+def slow_call(calls, seconds=0.3):
+    def fn(timeout):
+        calls.append(timeout)
+        time.sleep(seconds)
+        return Raw(len(calls))
+    return fn
+
+
+def test_hedge_waits_when_no_concurrency_slot_is_free():
+    scheduler = AzureScheduler()
+    scheduler.gate = PriorityGate(1)
+    scheduler.gate.acquire(PRIORITY_INTERACTIVE, time.monotonic() + 1)  # held by the call being hedged
+    calls = []
+    assert scheduler._hedged("chat", slow_call(calls), time.monotonic() + 5, hedge_after=0.05) == 1
+    assert len(calls) == 1
+
+
+def test_hedge_takes_a_slot_and_gives_it_back():
+    scheduler = AzureScheduler()
+    scheduler.gate = PriorityGate(2)
+    scheduler.gate.acquire(PRIORITY_INTERACTIVE, time.monotonic() + 1)
+    calls = []
+    scheduler._hedged("chat", slow_call(calls), time.monotonic() + 5, hedge_after=0.05)
+    assert len(calls) == 2
+    time.sleep(0.4)  # the duplicate finishes
+    assert scheduler.gate.free == 1
@@ -0,0 +1,47 @@
+# tests/test_chat_routes.py
+
+import time
+
+import httpx
+import openai
+import pytest
+
+import logic.azure_calls as azure_calls
+from logic.deadline import Deadline, deadline_scope
+
+
+class Response:
+    usage = None
+
+    def __init__(self, deployment):
+        self.choices = [type("Choice", (), {"message": type("Message", (), {"content": f" from {deployment} "})()})()]
+
+
+@pytest.fixture
+def primary_times_out(monkeypatch):
+    route = azure_calls.CHAT_ROUTES["default"]
+    monkeypatch.setattr(route, "fallback", "backup-deployment")
+    calls = []
+
+    def create(deployment, *args):
+        calls.append(deployment)
+        if deployment != "backup-deployment":
+            raise openai.APITimeoutError(request=httpx.Request("POST", "https://example.invalid"))
+        return Response(deployment)
+
+    monkeypatch.setattr(azure_calls, "_create_chat", create)
+    return calls
+
+
+def test_slow_primary_falls_back(primary_times_out):
+    assert azure_calls.get_chat_completion([{"role": "user", "content": "hi"}]) == "from backup-deployment"
+    assert primary_times_out[-1] == "backup-deployment"
+
+
+def test_no_fallback_once_the_request_deadline_is_gone(primary_times_out):
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+    with deadline_scope(deadline):
+        with pytest.raises(openai.APITimeoutError):
+            azure_calls.get_chat_completion([{"role": "user", "content": "hi"}])
+    assert "backup-deployment" not in primary_times_out
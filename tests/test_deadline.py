@@ -0,0 +1,126 @@
+# tests/test_deadline.py
+
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import httpx
+import openai
+import pytest
+
+from logic.deadline import Deadline, DeadlineExceeded, RequestCancelled, deadline_scope, bounded_timeout, current_deadline
+from logic.singleflight import AsyncSingleFlight
+
+
+def test_check_raises_once_expired():
+    deadline = Deadline(0.05)
+    deadline.check("embed")
+    time.sleep(0.06)
+    assert deadline.expired
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("embed")
+
+
+def test_cancelled_only_when_last_member_leaves():
+    deadline = Deadline(5)
+    deadline.join()
+    deadline.join()
+    deadline.leave()
+    assert not deadline.cancelled.is_set()
+    deadline.leave()
+    assert deadline.expired
+    with pytest.raises(RequestCancelled):
+        deadline.check("search")
+
+
+def test_wait_for_stops_waiting_on_cancel():
+    deadline = Deadline(5)
+    future = Future()
+    start = time.monotonic()
+    threading.Timer(0.05, deadline.cancel, args=("test",)).start()
+    assert deadline.wait_for(future) is False
+    assert time.monotonic() - start < 1
+
+
+def test_sleep_wakes_up_and_raises_on_cancel():
+    deadline = Deadline(5)
+    deadline.cancel("test")
+    with pytest.raises(RequestCancelled):
+        deadline.sleep(5)
+
+
+def test_bounded_timeout_uses_current_deadline():
+    assert bounded_timeout(30) == 30
+    with deadline_scope(Deadline(2)) as deadline:
+        assert current_deadline() is deadline
+        assert bounded_timeout(30) <= 2
+    assert current_deadline() is None
+
+
+@pytest.fixture
+def chat_api():
+    import chat_api
+    return chat_api
+
+
+def test_generate_answer_degrades_on_sdk_timeout(chat_api, monkeypatch):
+    def timeout(*args):
+        raise openai.APITimeoutError(request=httpx.Request("POST", "https://example.invalid"))
+    monkeypatch.setattr(chat_api, "get_answer_from_metadata", timeout)
+    answer, degraded = chat_api.generate_answer("q", ["chunk"], "מכבי", "זהב", "he", Deadline(30))
+    assert degraded and "- chunk" in answer
+
+
+def test_generate_answer_degrades_on_any_error_after_expiry(chat_api, monkeypatch):
+    deadline = Deadline(30)
+
+    def fail(*args):
+        deadline.expires = time.monotonic()
+        raise RuntimeError("connection reset")
+    monkeypatch.setattr(chat_api, "get_answer_from_metadata", fail)
+    assert chat_api.generate_answer("q", ["chunk"], "מכבי", "זהב", "en", deadline)[1] is True
+
+
+def test_generate_answer_raises_errors_with_time_left(chat_api, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("bad request")
+    monkeypatch.setattr(chat_api, "get_answer_from_metadata", fail)
+    with pytest.raises(RuntimeError):
+        chat_api.generate_answer("q", ["chunk"], "מכבי", "זהב", "he", Deadline(30))
+
+
+def test_cancelled_run_is_not_joined():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        releases = []
+
+        async def run(deadline):
+            release = asyncio.Event()
+            releases.append(release)
+            await release.wait()
+            return deadline
+
+        def join():
+            return flight.join("key", run, lambda: Deadline(5), stale=lambda deadline: deadline.expired)
+
+        first, deadline = join()
+        assert join() == (first, deadline)
+
+        deadline.cancel("client disconnected")
+        second, fresh = join()
+        assert second is not first and fresh is not deadline and not fresh.expired
+
+        await asyncio.sleep(0)
+        releases[0].set()
+        await first
+        await asyncio.sleep(0)
+        # the stale run finishing must not drop the run that replaced it
+        assert join() == (second, fresh)
+
+        releases[1].set()
+        assert await second is fresh
+        await asyncio.sleep(0)
+        assert "key" not in flight._calls
+
+    asyncio.run(scenario())
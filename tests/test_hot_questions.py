@@ -0,0 +1,72 @@
+# tests/test_hot_questions.py
+
+import json
+
+import numpy as np
+import pytest
+
+import src.hot_questions as hot_questions
+from src.hot_questions import QueryLog, deidentify, cluster_questions
+
+
+@pytest.mark.parametrize("question, logged", [
+    ("My ID is 123456789, what is covered?", "my id is <number>, what is covered"),
+    ("call me at 050-123-4567", "call me at <number>"),
+    ("mail me at a.b@example.com please", "mail me at <email> please"),
+    ("תעודת זהות 012345678 מה מגיע לי?", "תעודת זהות <number> מה מגיע לי"),
+    ("Is acupuncture covered?  ", "is acupuncture covered"),
+    ("I am 31, is it covered?", "i am 31, is it covered"),  # short numbers (ages, percentages) are kept
+])
+def test_deidentify_masks_contact_details_and_long_numbers(question, logged):
+    assert deidentify(question) == logged
+
+
+def test_long_or_empty_questions_are_not_logged():
+    assert deidentify("a" * (hot_questions.QUERY_LOG_MAX_CHARS + 1)) is None
+    assert deidentify("   ") is None
+
+
+@pytest.fixture
+def query_log(tmp_path, monkeypatch):
+    log = QueryLog(tmp_path / "query_stats.sqlite")
+    monkeypatch.setattr(hot_questions, "_query_log", log)
+    monkeypatch.setattr(hot_questions, "HOT_QUESTIONS_PATH", tmp_path / "hot_questions.json")
+    return log
+
+
+def test_counts_are_added_up_across_flushes(query_log):
+    for _ in range(2):
+        query_log.record("Is acupuncture covered?", "מכבי", "זהב", "en")
+    query_log.record("My ID is 123456789", "מכבי", "זהב", "en")
+    query_log.flush()
+    query_log.record("is acupuncture covered", "מכבי", "זהב", "en")
+    assert query_log.counts() == [
+        ("is acupuncture covered", "מכבי", "זהב", "en", 3),
+        ("my id is <number>", "מכבי", "זהב", "en", 1),
+    ]
+    assert not query_log.pending
+
+
+def test_similar_questions_form_one_cluster():
+    vectors = np.array([[1, 0], [0.99, 0.1], [0, 1]], dtype="float32")
+    clusters = cluster_questions(["a", "a'", "b"], [2, 5, 4], vectors)
+    assert clusters == [
+        {"question": "a'", "count": 7, "variants": 2},
+        {"question": "b", "count": 4, "variants": 1},
+    ]
+
+
+def test_rare_and_masked_questions_never_become_hot(query_log, monkeypatch):
+    import src.embd_chunks as embd_chunks
+
+    asked = {"is acupuncture covered": 5, "my card is <number>": 9, "what about glasses": 1}
+    for question, count in asked.items():
+        for _ in range(count):
+            query_log.record(question, "מכבי", "זהב", "he")
+    # every question is its own cluster
+    monkeypatch.setattr(embd_chunks, "embed_queries", lambda texts, priority=None: np.eye(len(texts)).tolist())
+
+    result = hot_questions.build_hot_questions()
+    assert [c["question"] for scope in result["scopes"] for c in scope["questions"]] == ["is acupuncture covered"]
+    assert json.loads(hot_questions.HOT_QUESTIONS_PATH.read_text(encoding="utf-8")) == result
+    assert hot_questions.load_hot_questions(10)[0]["questions"] == ["is acupuncture covered"]
@@ -0,0 +1,160 @@
+# tests/test_kb_snapshots.py
+
+import pytest
+
+import src.retrieval_service as retrieval_service
+from src.retrieval_service import RetrievalShard, KBVersionMismatch, retrieve_contexts
+
+
+def test_build_publishes_complete_snapshot(kb, build):
+    assert kb.kb_version() == "legacy"
+    version = build()
+    assert kb.kb_version() == version
+    assert kb.KB_CURRENT_PATH.read_text(encoding="utf-8") == version
+    assert kb.load_manifest()["version"] == version
+    assert kb.is_kb_ready()
+    # Nothing is left behind in staging, and CURRENT is the only non-snapshot entry
+    assert sorted(p.name for p in kb.KB_SNAPSHOTS_DIR.iterdir()) == sorted(["CURRENT", version])
+
+
+def test_versions_sort_in_publish_order(kb, build):
+    versions = [build() for _ in range(3)]
+    assert versions == sorted(versions)
+    assert [v["version"] for v in kb.list_kb_versions()] == versions[::-1]
+    assert [v["current"] for v in kb.list_kb_versions()] == [True, False, False]
+
+
+def test_rollback_to_previous_and_named_version(kb, build):
+    first, second, third = build(), build(), build()
+    assert kb.rollback_kb() == second
+    assert kb.kb_version() == second
+    assert kb.rollback_kb() == first
+    with pytest.raises(ValueError):
+        kb.rollback_kb()
+    assert kb.rollback_kb(third) == third
+    with pytest.raises(ValueError):
+        kb.rollback_kb("no-such-version")
+    assert kb.kb_version() == third
+
+
+def test_prune_keeps_current_and_recent_versions(kb, build, monkeypatch):
+    versions = [build() for _ in range(3)]
+    kb.prune_kb_versions(keep=1)
+    assert [v["version"] for v in kb.list_kb_versions()] == [versions[2], versions[1]]
+
+    # Versions newer than the one served (after a rollback) are never pruned
+    newest = build()
+    kb.rollback_kb(versions[1])
+    kb.prune_kb_versions(keep=0)
+    assert [v["version"] for v in kb.list_kb_versions()] == [newest, versions[2], versions[1]]
+
+
+@pytest.fixture
+def shard(kb, build, monkeypatch):
+    build()
+    monkeypatch.setattr(retrieval_service, "_router", retrieval_service.RetrievalRouter("local"))
+    return retrieval_service.get_router().shard_for("מכבי")
+
+
+def test_shard_switches_to_published_version(kb, build, shard):
+    old = shard.snapshot
+    version = build(pca_dim=8)
+    vecs = kb.embed_queries(["דיקור סיני"], version=version)
+    context = shard.contexts("זהב", vecs, 3, 10, version=version)[0]
+    assert shard.snapshot.version == version and shard.snapshot is not old
+    assert context and all("מאוחדת" not in chunk for chunk in context)
+
+
+def test_shard_rejects_queries_embedded_for_another_version(kb, build, shard):
+    old_version = shard.snapshot.version
+    old_vecs = kb.embed_queries(["דיקור סיני"], version=old_version)
+    build(pca_dim=8)
+    with pytest.raises(KBVersionMismatch):
+        shard.contexts("זהב", old_vecs, 3, 10, version=old_version)
+
+
+def test_snapshot_in_use_is_unaffected_by_switch(kb, build, shard):
+    snapshot = shard.snapshot
+    vecs = kb.embed_queries(["משקפיים"], version=snapshot.version)
+    hits = snapshot.search("זהב", vecs, 5)
+    build(pca_dim=8)
+    shard.contexts("זהב", kb.embed_queries(["משקפיים"]), 3, 10)  # loads the new version
+    # The old snapshot still resolves its own ids against its own metadata and index
+    assert shard.snapshot is not snapshot
+    assert snapshot.search("זהב", vecs, 5) == hits
+    assert snapshot.contexts("זהב", vecs, 3, 10)
+
+
+def test_retrieve_contexts_re_embeds_when_shard_moved_on(kb, build, monkeypatch):
+    stale, current = build(), build()
+    versions = iter([stale, current])
+    monkeypatch.setattr(retrieval_service, "kb_version", lambda: next(versions))
+    monkeypatch.setattr(retrieval_service, "embed_queries", lambda texts, priority=None, version=None: [[version]] * len(texts))
+
+    class Router:
+        def contexts(self, hmo, tier, query_vecs, top_k, candidates, lang, version):
+            if version != current:
+                raise KBVersionMismatch(f"shard serves {current}")
+            return [[f"context@{vec[0]}"] for vec in query_vecs]
+
+    monkeypatch.setattr(retrieval_service, "get_router", lambda: Router())
+    version, contexts = retrieve_contexts("מכבי", "זהב", [("דיקור סיני", "he"), ("glasses", "en")], 3, 10)
+    assert version == current
+    assert contexts == [[f"context@{current}"], [f"context@{current}"]]
+
+
+def test_retrieve_contexts_starts_on_the_requested_version(kb, build, monkeypatch):
+    first, second = build(), build()
+    monkeypatch.setattr(retrieval_service, "embed_queries", lambda texts, priority=None, version=None: [[version]] * len(texts))
+
+    class Router:
+        def contexts(self, hmo, tier, query_vecs, top_k, candidates, lang, version):
+            return [[f"context@{vec[0]}"] for vec in query_vecs]
+
+    monkeypatch.setattr(retrieval_service, "get_router", lambda: Router())
+    assert kb.kb_version() == second
+    version, contexts = retrieve_contexts("מכבי", "זהב", [("כתרים", "he")], 3, 10, version=first)
+    assert (version, contexts) == (first, [[f"context@{first}"]])
+
+
+def test_remote_shard_reports_version_mismatch(kb, build):
+    from fastapi.testclient import TestClient
+
+    stale = build()
+    app = retrieval_service.create_shard_app("מכבי")
+    remote = retrieval_service.RemoteShard("מכבי", "http://shard")
+    remote.http = TestClient(app, base_url="http://shard")
+    vecs = kb.embed_queries(["כתרים"], version=stale)
+    assert remote.contexts("זהב", vecs, 3, 10, version=stale)
+
+    build(pca_dim=8)
+    with pytest.raises(KBVersionMismatch):
+        remote.contexts("זהב", vecs, 3, 10, version=stale)
+    assert remote.http.get("/health").json()["kb_version"] == kb.kb_version()
+
+
+def test_single_question_embeds_through_the_coalesced_path(kb, build):
+    version = build()
+    backend = kb._query_state(version)["backend"]
+    single, batched = [], []
+    backend.embed_one = lambda text, priority=None: single.append(text) or [0.0] * 4
+    embed = backend.embed
+    backend.embed = lambda texts, priority=None: batched.append(texts) or embed(texts, priority=priority)
+
+    kb.embed_queries(["כתרים"], version=version)
+    kb.embed_queries(["כתרים", "משקפיים", "שיאצו"], version=version)
+    assert single == ["כתרים"]
+    assert batched == [["משקפיים", "שיאצו"]]
+
+
+def test_switch_within_one_mtime_tick_is_seen(kb, build):
+    import os
+
+    first, second = build(), build()
+    kb.publish_kb_version(first)
+    os.utime(kb.KB_CURRENT_PATH, ns=(0, 0))
+    assert kb.kb_version() == first
+    # Another process publishes within the same (coarse) mtime tick
+    kb.publish_kb_version(second)
+    os.utime(kb.KB_CURRENT_PATH, ns=(0, 0))
+    assert kb.kb_version() == second
@@ -0,0 +1,23 @@
+# tests/test_log_config.py
+
+import json
+import queue
+import logging
+
+from logic.log_config import DroppingQueueHandler, JsonFormatter
+
+
+def test_exception_survives_the_queue():
+    log_queue = queue.Queue()
+    logger = logging.getLogger("tests.log_config")
+    logger.propagate = False
+    logger.addHandler(DroppingQueueHandler(log_queue))
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("failed for %s", "maccabi", extra={"route": "phase2"})
+
+    payload = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert payload["msg"] == "failed for maccabi"
+    assert payload["route"] == "phase2"
+    assert "ZeroDivisionError" in payload["exc"]
@@ -0,0 +1,20 @@
+# tests/test_retrieval_shards.py
+
+import pytest
+
+from src.retrieval_service import ShardSnapshot
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_standalone_shard_keeps_only_its_chunks_and_answers_the_same(kb, build, quantization):
+    version = build(quantization=quantization)
+    _, metadata = kb.load_data(version)
+    queries = kb.embed_queries(["טיפול שורש", "משקפיים", "דיקור סיני"], version=version)
+
+    for hmo in ["מכבי", "מאוחדת"]:
+        shared = ShardSnapshot(hmo, version)
+        standalone = ShardSnapshot(hmo, version, standalone=True)
+        assert standalone.indexes["he"].ntotal == len(standalone.metadata) == len(shared.ids) < len(metadata)
+        assert all(kb.chunk_applies_to(chunk, hmo) for chunk in standalone.metadata)
+        for tier in ["זהב", "כסף"]:
+            assert standalone.contexts(tier, queries, 3, 10) == shared.contexts(tier, queries, 3, 10)
@@ -0,0 +1,119 @@
+# tests/test_singleflight.py
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from logic.deadline import Deadline, DeadlineExceeded, RequestCancelled, current_deadline, deadline_scope
+from logic.singleflight import SingleFlight, AsyncSingleFlight, coalesce
+
+
+def test_concurrent_calls_share_one_run():
+    flight, calls, release = SingleFlight(), [], threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(flight.do, "key", slow) for _ in range(4)]
+        time.sleep(0.1)
+        release.set()
+        assert [f.result() for f in futures] == ["result"] * 4
+    assert len(calls) == 1
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    flight, release = SingleFlight(), threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("azure down")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(flight.do, "key", fail) for _ in range(2)]
+        time.sleep(0.1)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert flight.do("key", lambda: "recovered") == "recovered"
+
+
+def test_coalesce_keys_on_arguments():
+    calls = []
+
+    @coalesce
+    def embed(text, priority=0):
+        calls.append((text, priority))
+        return text.upper()
+
+    assert embed("a") == "A"
+    assert embed("a", priority=10) == "A"
+    assert calls == [("a", 0), ("a", 10)]
+
+
+def test_async_waiter_leaving_does_not_cancel_the_shared_call():
+    async def scenario():
+        flight, calls = AsyncSingleFlight(), []
+
+        async def run():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leaving = asyncio.ensure_future(flight.do("key", run))
+        staying = asyncio.ensure_future(flight.do("key", run))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        assert await staying == "answer"
+        assert calls == [1]
+        assert await flight.do("key", run) == "answer" and calls == [1, 1]
+
+    asyncio.run(scenario())
+
+
+def test_waiter_reruns_a_call_the_leader_lost_to_its_own_deadline():
+    flight, calls, release = SingleFlight(), [], threading.Event()
+
+    def translate():
+        calls.append(current_deadline())
+        if len(calls) == 1:
+            release.wait(5)
+            raise RequestCancelled("leader's client disconnected")
+        return "translated"
+
+    def request(deadline):
+        with deadline_scope(deadline):
+            return flight.do("שלום", translate)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(request, Deadline(5))
+        time.sleep(0.05)
+        waiter_deadline = Deadline(5)
+        waiter = pool.submit(request, waiter_deadline)
+        time.sleep(0.05)
+        release.set()
+        with pytest.raises(RequestCancelled):
+            leader.result()
+        assert waiter.result() == "translated"
+    assert calls[1] is waiter_deadline
+
+
+def test_waiter_stops_waiting_at_its_own_deadline():
+    flight, release = SingleFlight(), threading.Event()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flight.do, "key", lambda: release.wait(5))
+        time.sleep(0.05)
+        start = time.monotonic()
+        with deadline_scope(Deadline(0.1)):
+            with pytest.raises(DeadlineExceeded):
+                flight.do("key", lambda: "unused")
+        assert time.monotonic() - start < 1
+        release.set()
+        assert leader.result() is True
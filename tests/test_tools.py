@@ -0,0 +1,48 @@
+# tests/test_tools.py
+
+import json
+
+from tools import TOOL_REGISTRY, PHASE1_SLOTS, handle_tool_call, filled_slot, select_tools, phase1_tool_args
+
+
+def names(tools):
+    return [tool["function"]["name"] for tool in tools]
+
+
+def test_valid_input_fills_its_slot():
+    result = handle_tool_call("collect_card_number", json.dumps({"card_number": "123456789"}))
+    assert filled_slot("collect_card_number", result) == "card_number"
+    result = handle_tool_call("collect_age", json.dumps({"age": 31}))
+    assert filled_slot("collect_age", result) == "age"
+
+
+def test_invalid_input_fills_nothing():
+    for tool, args in [
+        ("collect_card_number", {"card_number": "12345"}),
+        ("collect_id_number", {"id_number": "abc"}),
+        ("collect_age", {"age": 150}),
+        ("collect_hmo", {"hmo": "Other"}),
+    ]:
+        assert filled_slot(tool, handle_tool_call(tool, json.dumps(args))) is None
+
+
+def test_confirmation_fills_no_slot():
+    assert filled_slot("confirm_information", handle_tool_call("confirm_information", '{"confirmation": "yes"}')) is None
+    assert filled_slot("unknown_tool", "{}") is None
+
+
+def test_only_missing_collectors_are_sent():
+    tools = names(select_tools({"name", "id_number", "gender"}))
+    assert tools == ["collect_age", "collect_hmo", "collect_card_number", "collect_insurance_tier"]
+
+
+def test_collectors_stay_available_for_corrections_at_confirmation():
+    tools = names(select_tools(PHASE1_SLOTS))
+    assert "confirm_information" in tools
+    assert set(tools) == set(TOOL_REGISTRY)
+
+
+def test_no_tools_after_confirmation():
+    assert select_tools(PHASE1_SLOTS, confirmed=True) == []
+    assert phase1_tool_args(PHASE1_SLOTS, confirmed=True) == {"tools": None, "tool_choice": None}
+    assert phase1_tool_args(set())["tool_choice"] == "auto"
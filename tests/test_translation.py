@@ -0,0 +1,58 @@
+# tests/test_translation.py
+
+import pytest
+
+import logic.translation as translation
+from logic.translation import TranslationCache, detect_script, normalize_text, glossary_only_translation, translate_to_hebrew
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    """Translation cache in tmp_path; LLM calls are recorded and answered with a fixed Hebrew text."""
+    monkeypatch.setattr(translation, "_cache", TranslationCache(tmp_path / "translation_cache.sqlite"))
+    calls = []
+
+    def complete(messages, **kwargs):
+        calls.append(messages[-1]["content"])
+        return " האם דיקור סיני מכוסה? "
+    monkeypatch.setattr(translation, "get_chat_completion", complete)
+    return calls
+
+
+@pytest.mark.parametrize("text, script", [
+    ("האם דיקור סיני מכוסה?", "he"),
+    ("Is acupuncture covered?", "en"),
+    ("מה מגיע לי ב-Maccabi?", "he"),  # mostly Hebrew
+    ("1234 ?!", ""),
+])
+def test_detect_script(text, script):
+    assert detect_script(text) == script
+
+
+def test_normalize_text_is_the_cache_key_form():
+    assert normalize_text("  Is   Acupuncture covered?! ") == "is acupuncture covered"
+    assert normalize_text("Is acupuncture covered") == normalize_text("is ACUPUNCTURE covered?")
+
+
+def test_glossary_only_translation():
+    assert glossary_only_translation("Maccabi gold HMO") == "מכבי זהב קופת חולים"
+    assert glossary_only_translation("my insurance tier in Clalit") == "רמת ביטוח כללית"
+    assert glossary_only_translation("Maccabi gold acupuncture") is None  # "acupuncture" needs the LLM
+    assert glossary_only_translation("the info please") is None  # nothing to translate
+
+
+def test_hebrew_passes_through_without_llm(llm):
+    assert translate_to_hebrew("האם דיקור סיני מכוסה?") == "האם דיקור סיני מכוסה?"
+    assert llm == []
+
+
+def test_glossary_only_input_skips_llm(llm):
+    assert translate_to_hebrew("Maccabi Gold") == "מכבי זהב"
+    assert llm == []
+
+
+def test_leftover_words_go_to_llm_once_then_cache(llm):
+    assert translate_to_hebrew("Is acupuncture covered in Maccabi?") == "האם דיקור סיני מכוסה?"
+    assert translate_to_hebrew("is acupuncture covered in maccabi") == "האם דיקור סיני מכוסה?"
+    assert llm == ["Is acupuncture covered in Maccabi?"]
+    assert translation.get_translation_cache().get("en-he", "is acupuncture covered in maccabi") == "האם דיקור סיני מכוסה?"
@@ -2,7 +2,7 @@
 from typing import Literal
 import json
 import logging
-from typing import List
+from typing import Iterable, List, Optional
 import logging
 
 # USER INFORMATION COLLECTION
@@ -53,9 +53,7 @@ def collect_card_number(card_number: str) -> str:
             "message": "Great. Lastly, what is your insurance membership tier? (זהב / כסף / ארד)",
             "card_number": card_number
         })
-    return json.dumps({
-        "message": "Thanks. Lastly, what is your insurance membership tier? (זהב / כסף / ארד)"
-    })
+    return "HMO card number must be exactly 9 digits."
 
 def collect_insurance_tier(tier: str) -> str:
     # Check if the insurance tier is one of the specified options
@@ -78,7 +76,8 @@ def confirm_information(confirmation: str) -> str:
     elif confirmation.lower() in ["no"]:
         return json.dumps({
             "message": f"Okay. Please restart the form and provide your information again.",
-            "confirmed": False
+            "confirmed": False,
+            "restart": True
         })
     else:
         return json.dumps({
@@ -204,3 +203,65 @@ tool_descriptions = [
     },
 
 ]
+
+
+# --- Tool registry ---
+# tool name -> (function, argument names, phase 1 slot it fills). Drives dispatch, and which tool
+# schemas a phase 1 turn still needs to send.
+
+TOOL_REGISTRY = {
+    "collect_name": (collect_name, ["first_name", "last_name"], "name"),
+    "collect_id_number": (collect_id_number, ["id_number"], "id_number"),
+    "collect_gender": (collect_gender, ["gender"], "gender"),
+    "collect_age": (collect_age, ["age"], "age"),
+    "collect_hmo": (collect_hmo, ["hmo"], "hmo"),
+    "collect_card_number": (collect_card_number, ["card_number"], "card_number"),
+    "collect_insurance_tier": (collect_insurance_tier, ["tier"], "tier"),
+    "confirm_information": (confirm_information, ["confirmation"], None),
+}
+
+PHASE1_SLOTS: List[str] = [slot for _, _, slot in TOOL_REGISTRY.values() if slot]
+
+_TOOL_SCHEMAS = {tool["function"]["name"]: tool for tool in tool_descriptions}
+
+
+def handle_tool_call(tool_name: str, arguments: str) -> str:
+    """Run the tool the model called, with its JSON arguments."""
+    if tool_name not in TOOL_REGISTRY:
+        return "Unknown tool call."
+    func, arg_names, _ = TOOL_REGISTRY[tool_name]
+    data = json.loads(arguments)
+    return func(*(data[name] for name in arg_names))
+
+
+def filled_slot(tool_name: str, result: str) -> Optional[str]:
+    """The slot a tool call filled, if it succeeded (tools answer invalid input with plain text, not JSON)."""
+    slot = TOOL_REGISTRY.get(tool_name, (None, None, None))[2]
+    if slot is None:
+        return None
+    try:
+        return slot if isinstance(json.loads(result), dict) else None
+    except json.JSONDecodeError:
+        return None
+
+
+def select_tools(collected: Iterable[str], confirmed: bool = False) -> List[dict]:
+    """
+    Tool schemas still useful for the next phase 1 turn: the collectors of the slots not filled yet
+    (several, since users often give more than one detail per message); once every slot is filled,
+    confirm_information plus all the collectors, so a detail can still be corrected before confirming.
+    None after confirmation.
+    """
+    if confirmed:
+        return []
+    collected = set(collected)
+    remaining = [name for name, (_, _, slot) in TOOL_REGISTRY.items() if slot and slot not in collected]
+    if not remaining:
+        remaining = list(TOOL_REGISTRY)
+    return [_TOOL_SCHEMAS[name] for name in remaining]
+
+
+def phase1_tool_args(collected: Iterable[str], confirmed: bool = False) -> dict:
+    """`tools` / `tool_choice` arguments of get_chat_completion for the next phase 1 turn."""
+    tools = select_tools(collected, confirmed)
+    return {"tools": tools or None, "tool_choice": "auto" if tools else None}